@@ -66,11 +66,13 @@ if st.button("Ask"):
 
     response = requests.post(
                 url=f"{API_URL}/chat/",
-                params={"query": user_query},
+                json={"query": user_query, "session_id": st.session_state.get("chat_session_id")},
                 # json={"metadata_filter": metadata_filter}
             )
 
     if response.status_code == 200:
+                # keep the session so follow-up questions reuse the conversation
+                st.session_state["chat_session_id"] = response.json().get("session_id") or st.session_state.get("chat_session_id")
                 st.markdown("###Bot's Answer")
                 # st.markdown(response.json()["response"])
                 st.write(response.text)
@@ -1,25 +1,22 @@
 import os
 import tempfile
-from fastapi import FastAPI, UploadFile, File
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
 from src.run_analysis import InvoicePolicyComparator
 from src.logger import logging as log
 from src.exception import CustomException
 from uuid import uuid4
 from src.utils import get_data_to_embed
-from src.vector_store.db import VectorStore
+from src.vector_store.ingestion import get_vector_store
+from src.aggregates import ClaimAggregates
+from src.chat_memory import ChatMemory
+from src.admission import gates, client_id, check_content_length, upload_form, save_upload, check_zip_limits
 from src.rag_agent import graph
 from fastapi import FastAPI, HTTPException
-from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.messages import HumanMessage
 from typing import Dict, List, Optional
 from pydantic import BaseModel
 from src.config import Config
-from langchain import hub
-from langgraph.graph import START, END, StateGraph, MessagesState
-from langchain.chat_models import init_chat_model
-from langchain_core.tools import tool
-from langgraph.prebuilt import ToolNode, tools_condition
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_chroma import Chroma
 from typing import List
 from src.logger import logging as log
 
@@ -27,162 +24,147 @@ from src.logger import logging as log
 app = FastAPI()
 
 invoice_compare = InvoicePolicyComparator()
-llm = init_chat_model("llama3-8b-8192", model_provider="groq")
-graph_builder = StateGraph(MessagesState)
-prompt = hub.pull("rlm/rag-prompt")
 config = Config()
-vector_store = VectorStore()
+vector_store = get_vector_store()
+aggregates = ClaimAggregates(vector_store=vector_store)
+chat_memory = ChatMemory()
+
+
+def analyse_and_store(zip_path: str, policy_path: str) -> None:
+    """Blocking part of claim processing; runs in the threadpool so the event loop stays free"""
+    decisions, invoice_texts = invoice_compare.process_zip_and_analyse(
+                        zip_file_path=zip_path, 
+                        policy_path=policy_path
+                    )
+    log.info(f"Analysed {zip_path} and {policy_path}")
+    
+    documents = get_data_to_embed(decisions=decisions, invoice_texts=invoice_texts)
+    log.info("Documnets prepared for Embedding with metadata")
+    
+    vector_store.add_documents(documents=documents)
+    log.info("Storing Dicuments to Vector Store and Returning TRUE")
+
+    # Only batches that made it into the vector store are counted. Both steps skip claim ids they
+    # have already seen, so if this one fails, re-submitting the claim stores nothing twice and
+    # counts what was missed.
+    aggregates.record(documents)
 
 
-@app.post("/process_claim/")
-async def process_claim(invoice_file: UploadFile = File(), policy_file: UploadFile = File())->bool:
+# The files are read by upload_form after admission, so the request body is described here for /docs
+UPLOAD_REQUEST_BODY = {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+    "type": "object",
+    "required": ["invoice_file", "policy_file"],
+    "properties": {
+        "invoice_file": {"type": "string", "format": "binary"},
+        "policy_file": {"type": "string", "format": "binary"}
+    }
+}}}}}
+
+
+@app.post("/process_claim/", openapi_extra=UPLOAD_REQUEST_BODY)
+async def process_claim(request: Request)->bool:
     """FastAPI endpoint to process claim analysis.
     
     Params:
-        invoice_file: uploaded invoice zip file.
-        policy_file: uploaded policy pdf file.
+        invoice_file: uploaded invoice zip file (multipart form field).
+        policy_file: uploaded policy pdf file (multipart form field).
     
     Returns:
         dictionary of results.
     """
 
-    try:
-        # Save files temporarily
-        with tempfile.TemporaryDirectory() as temp_directory:
-            log.info("BACKEND::Inside Temp directory")
-            zip_path = os.path.join(temp_directory, invoice_file.filename)
-            policy_path = os.path.join(temp_directory, policy_file.filename)
-            log.info(f"zip path: {zip_path}, \npdf path: {policy_path}")
-
-            with open(zip_path, "wb") as f:
-                f.write(await invoice_file.read())
-
-            with open(policy_path, "wb") as f:
-                f.write(await policy_file.read())
-
-            # Process claim
-            log.info(f"About to analyse {invoice_file.filename} and {policy_file.filename}")
-            decisions, invoice_texts = invoice_compare.process_zip_and_analyse(
-                                zip_file_path=zip_path, 
-                                policy_path=policy_path
-                            )
-            log.info(f"Analysed {invoice_file.filename} and {policy_file.filename}")
+    # Oversized and over-quota requests are turned away before their body is read
+    check_content_length(request)
+    async with gates["process_claim"].admit(client_id(request)):
+        async with upload_form(request, ["invoice_file", "policy_file"]) as (invoice_file, policy_file):
+            try:
+                # Save files temporarily
+                with tempfile.TemporaryDirectory() as temp_directory:
+                    log.info("BACKEND::Inside Temp directory")
+                    zip_path = os.path.join(temp_directory, os.path.basename(invoice_file.filename))
+                    policy_path = os.path.join(temp_directory, os.path.basename(policy_file.filename))
+                    log.info(f"zip path: {zip_path}, \npdf path: {policy_path}")
+
+                    await save_upload(invoice_file, zip_path)
+                    await save_upload(policy_file, policy_path)
+                    check_zip_limits(zip_path)
+
+                    # Process claim
+                    log.info(f"About to analyse {invoice_file.filename} and {policy_file.filename}")
+                    await run_in_threadpool(analyse_and_store, zip_path, policy_path)
+
+                return True
             
-            documents = get_data_to_embed(decisions=decisions, invoice_texts=invoice_texts)
-            log.info("Documnets prepared for Embedding with metadata")
-            
-            vector_store.add_documents(documents=documents)
-            log.info("Storing Dicuments to Vector Store and Returning TRUE")
+            except CustomException as e:
+                log.error(f"{str(e)}")
+                return False
+
 
-        return True
+@app.get("/admission/stats/")
+async def admission_stats() -> Dict:
+    """Queue depth, in-flight requests and rejection counts per endpoint, for the worker that answers."""
+    return {name: gate.stats() for name, gate in gates.items()}
     
+
+
+@app.get("/claims/summary/")
+async def claims_summary(employee_name: Optional[str] = None, month: Optional[str] = None) -> Dict:
+    """FastAPI endpoint for precomputed claim totals.
+
+    Params:
+        employee_name: optional employee to restrict the totals to.
+        month: optional invoice month as YYYY-MM.
+
+    Returns:
+        claim counts and approved amounts, overall and by reimbursement status.
+    """
+    try:
+        return aggregates.summary(employee_name=employee_name, month=month)
     except CustomException as e:
         log.error(f"{str(e)}")
-        return False
-    
+        raise HTTPException(status_code=500, detail="Could not read claim summary")
 
 
 class ChatRequest(BaseModel):
     query: str
     metadata_filter: Optional[Dict] = None
+    session_id: Optional[str] = None
 
 class ChatResponse(BaseModel):
     response: str
     status: str
     details: Optional[str] = None
-
-@tool(response_format="content_and_artifact")
-def retrieve(query: str):
-    """Retrieve information related to a query."""
-    retrieved_docs = vector_store.similarity_search(query, k=2)
-    serialized = "\n\n".join(
-        (f"Source: {doc.metadata}\n" f"Content: {doc.page_content}")
-        for doc in retrieved_docs
-    )
-    return serialized, retrieved_docs
-
-# Step 1: Generate an AIMessage that may include a tool-call to be sent.
-def query_or_respond(state: MessagesState):
-    """Generate tool call for retrieval or respond."""
-    llm_with_tools = llm.bind_tools([retrieve])
-    response = llm_with_tools.invoke(state["messages"])
-    # MessagesState appends messages to state instead of overwriting
-    return {"messages": [response]}
-
-
-# Step 2: Execute the retrieval.
-tools = ToolNode([retrieve])
-
-
-# Step 3: Generate a response using the retrieved content.
-def generate(state: MessagesState):
-    """Generate answer."""
-    # Get generated ToolMessages
-    recent_tool_messages = []
-    for message in reversed(state["messages"]):
-        if message.type == "tool":
-            recent_tool_messages.append(message)
-        else:
-            break
-    tool_messages = recent_tool_messages[::-1]
-
-    # Format into prompt
-    docs_content = "\n\n".join(doc.content for doc in tool_messages)
-    system_message_content = (
-        "You are an assistant for question-answering tasks. "
-        "Use the following pieces of retrieved context to answer "
-        "the question. If you don't know the answer, say that you "
-        "don't know. Use three sentences maximum and keep the "
-        "answer concise."
-        "\n\n"
-        f"{docs_content}"
-    )
-    conversation_messages = [
-        message
-        for message in state["messages"]
-        if message.type in ("human", "system")
-        or (message.type == "ai" and not message.tool_calls)
-    ]
-    prompt = [SystemMessage(system_message_content)] + conversation_messages
-
-    # Run
-    response = llm.invoke(prompt)
-    return {"messages": [response]}
-
-
-graph_builder.add_node(query_or_respond)
-graph_builder.add_node(tools)
-graph_builder.add_node(generate)
-
-graph_builder.set_entry_point("query_or_respond")
-graph_builder.add_conditional_edges(
-    "query_or_respond",
-    tools_condition,
-    {END: END, "tools": "tools"},
-)
-graph_builder.add_edge("tools", "generate")
-graph_builder.add_edge("generate", END)
-
-graph = graph_builder.compile()
-
-
+    session_id: Optional[str] = None
 
 @app.post("/chat/", response_model=ChatResponse)
-async def chat_with_bot(request: ChatRequest):
+async def chat_with_bot(request: ChatRequest, http_request: Request):
     log.info("Inside CHatbot")
+    async with gates["chat"].admit(client_id(http_request)):
+        return await run_in_threadpool(answer_chat, request)
+
+
+def answer_chat(request: ChatRequest) -> ChatResponse:
+    """Runs the RAG graph for one chat turn (blocking)."""
+    # Earlier turns of the session are restored from the graph's checkpointer
+    session_id = request.session_id or str(uuid4())
     try:
         # Initialize metadata_filter if None
         # metadata_filter = request.metadata_filter or {}
-        
+
         # Create input messages
         input_messages = [HumanMessage(content=request.query)]
-        log.info(f"Input Message:: {input_messages}")
+        log.info(f"Input Message:: {input_messages}, session:: {session_id}")
 
         # Invoke the graph
         result = graph.invoke({
             "messages": input_messages,
             # "metadata_filter": metadata_filter
-        })
+        }, config={"configurable": {"thread_id": session_id}})
+        try:
+            chat_memory.after_turn(session_id)
+        except CustomException as e:
+            # pruning is housekeeping; the answer is already checkpointed
+            log.error(f"{str(e)}")
 
         # Extract the AI response
         ai_messages = [msg for msg in result['messages'] if msg.type == 'ai']
@@ -190,7 +172,8 @@ async def chat_with_bot(request: ChatRequest):
             return ChatResponse(
                 status="error",
                 response="No response generated by the chatbot",
-                details=str(result)
+                details=str(result),
+                session_id=session_id
             )
 
         final_response = ai_messages[-1].content
@@ -199,14 +182,18 @@ async def chat_with_bot(request: ChatRequest):
         return ChatResponse(
             status="success",
             response=final_response,
+            session_id=session_id,
             # metadata=metadata_filter
         )
 
     except Exception as e:
+        log.error(f"Chat turn failed for session {session_id}: {str(e)}")
+        # keep the session so the client does not lose its conversation over one failed turn
         return ChatResponse(
             status="error",
             response="Chatbot failed to process your query",
-            details=str(e)
+            details=str(e),
+            session_id=session_id
         )
 
 if __name__ == "__main__":
@@ -0,0 +1,215 @@
+import os
+import math
+import time
+import asyncio
+import zipfile
+from contextlib import asynccontextmanager
+from typing import Dict, List, Tuple
+from fastapi import HTTPException, Request, UploadFile
+from starlette.datastructures import UploadFile as FormFile
+from src.config import Config
+from src.logger import logging as log
+
+
+config = Config()
+
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+MAX_TRACKED_CLIENTS = 10000
+
+
+class AdmissionGate:
+    """
+    Admission control for one endpoint.
+
+    At most `concurrency` requests run at once and at most `queue_size` wait for a slot,
+    each for no longer than `queue_timeout` seconds. Every client also gets a token bucket
+    of `client_quota` requests per minute. Anything over a limit is turned away at once
+    with 429 (client quota) or 503 (endpoint saturated) and a Retry-After header, so the
+    requests that are admitted keep predictable latency.
+    """
+
+    def __init__(self, name: str, concurrency: int, queue_size: int, queue_timeout: float, client_quota: int) -> None:
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.client_quota = client_quota
+        self.slots = asyncio.Semaphore(concurrency)
+        self.buckets: Dict[str, Tuple[float, float]] = {}  # client -> (tokens, last refill time)
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = {"client_quota": 0, "queue_full": 0, "queue_timeout": 0}
+        self.avg_service_seconds = 1.0
+
+
+    def _reject(self, reason: str, status_code: int, retry_after: float) -> HTTPException:
+        self.rejected[reason] += 1
+        retry_after = max(1, math.ceil(retry_after))
+        log.warning(f"ADMISSION::{self.name} rejected ({reason}), retry after {retry_after}s")
+        return HTTPException(
+            status_code=status_code,
+            detail=f"{self.name} is over its {reason.replace('_', ' ')} limit, retry later",
+            headers={"Retry-After": str(retry_after)}
+        )
+
+
+    def _take_token(self, client_id: str) -> None:
+        """Token bucket refilled at client_quota per minute"""
+        now = time.monotonic()
+        rate = self.client_quota / 60.0
+        tokens, last = self.buckets.get(client_id, (float(self.client_quota), now))
+        tokens = min(float(self.client_quota), tokens + (now - last) * rate)
+        if tokens < 1:
+            self.buckets[client_id] = (tokens, now)
+            raise self._reject("client_quota", 429, (1 - tokens) / rate)
+        self.buckets[client_id] = (tokens - 1, now)
+
+        if len(self.buckets) > MAX_TRACKED_CLIENTS:
+            # drop clients whose bucket has refilled anyway
+            full_after = self.client_quota / rate
+            self.buckets = {
+                client: (bucket_tokens, bucket_last) for client, (bucket_tokens, bucket_last) in self.buckets.items()
+                if now - bucket_last < full_after
+            }
+
+
+    def _expected_wait(self) -> float:
+        return self.avg_service_seconds * (self.waiting + 1) / self.concurrency
+
+
+    @asynccontextmanager
+    async def admit(self, client_id: str):
+        """Hold one of the endpoint's slots for the duration of the request, or raise HTTPException"""
+        self._take_token(client_id)
+        if not self.slots.locked():
+            # a free slot is taken without suspending, so the queue check below can't race it
+            await self.slots.acquire()
+        elif self.waiting >= self.queue_size:
+            raise self._reject("queue_full", 503, self._expected_wait())
+        else:
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self.slots.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise self._reject("queue_timeout", 503, self._expected_wait())
+            finally:
+                self.waiting -= 1
+
+        self.active += 1
+        self.admitted += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self.slots.release()
+            # moving average of service time, used to size Retry-After
+            self.avg_service_seconds = 0.8 * self.avg_service_seconds + 0.2 * (time.monotonic() - started)
+
+
+    def stats(self) -> Dict:
+        """Counters of this API worker only; under --workers N each worker answers for itself"""
+        return {
+            "worker_pid": os.getpid(),
+            "active": self.active,
+            "queue_depth": self.waiting,
+            "concurrency": self.concurrency,
+            "queue_size": self.queue_size,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "avg_service_seconds": round(self.avg_service_seconds, 3)
+        }
+
+
+def per_worker(limits: Dict, workers: int) -> Dict:
+    """Share of service-wide limits one API worker enforces (at least 1 of each)"""
+    workers = max(workers, 1)
+    shares = {key: max(1, math.ceil(limits[key] / workers)) for key in ("concurrency", "queue_size", "client_quota")}
+    return {**limits, **shares}
+
+
+gates = {
+    name: AdmissionGate(name, **per_worker(limits, config.API_WORKERS))
+    for name, limits in config.ADMISSION_LIMITS.items()
+}
+
+
+def client_id(request: Request) -> str:
+    """
+    Key used for per-client quotas: the socket peer or, behind a reverse proxy, the address the
+    proxy adds to CLIENT_ID_HEADER (the last entry, so a client can't pick its own bucket)
+    """
+    if config.CLIENT_ID_HEADER:
+        forwarded = request.headers.get(config.CLIENT_ID_HEADER)
+        if forwarded:
+            return forwarded.split(",")[-1].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def check_content_length(request: Request, max_bytes: int = config.MAX_REQUEST_BYTES) -> None:
+    """Turn away a body declared larger than max_bytes before any of it is read"""
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > max_bytes:
+        raise HTTPException(status_code=413, detail=f"Request body is larger than {max_bytes} bytes")
+
+
+@asynccontextmanager
+async def upload_form(request: Request, fields: List[str], max_bytes: int = config.MAX_REQUEST_BYTES):
+    """
+    Parse a multipart body into the uploads named by `fields`, failing with 413 as soon as more
+    than max_bytes have been received (chunked bodies have no Content-Length to check).
+
+    Endpoints call this after admission instead of declaring File() parameters, which FastAPI
+    would spool to disk before the handler (and so the gate) ever ran.
+    """
+    received = 0
+
+    async def receive():
+        nonlocal received
+        message = await request.receive()
+        if message["type"] == "http.request":
+            received += len(message.get("body", b""))
+            if received > max_bytes:
+                raise HTTPException(status_code=413, detail=f"Request body is larger than {max_bytes} bytes")
+        return message
+
+    form = await Request(request.scope, receive).form(max_files=len(fields))
+    try:
+        uploads = [form.get(field) for field in fields]
+        missing = [field for field, upload in zip(fields, uploads) if not isinstance(upload, FormFile)]
+        if missing:
+            raise HTTPException(status_code=422, detail=f"Missing file fields: {', '.join(missing)}")
+        yield uploads
+    finally:
+        await form.close()
+
+
+async def save_upload(upload: UploadFile, path: str, max_bytes: int = config.MAX_UPLOAD_BYTES) -> None:
+    """Stream an upload to disk in chunks, failing with 413 as soon as it exceeds max_bytes"""
+    if upload.size is not None and upload.size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"{upload.filename} is larger than {max_bytes} bytes")
+    written = 0
+    with open(path, "wb") as f:
+        while chunk := await upload.read(UPLOAD_CHUNK_BYTES):
+            written += len(chunk)
+            if written > max_bytes:
+                raise HTTPException(status_code=413, detail=f"{upload.filename} is larger than {max_bytes} bytes")
+            f.write(chunk)
+
+
+def check_zip_limits(zip_path: str) -> None:
+    """Reject ZIPs with too many members or too much uncompressed data before anything is extracted"""
+    try:
+        with zipfile.ZipFile(zip_path, "r") as zip_ref:
+            members = [info for info in zip_ref.infolist() if not info.is_dir()]
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Invoice file is not a valid ZIP archive")
+
+    if len(members) > config.MAX_ZIP_MEMBERS:
+        raise HTTPException(status_code=413, detail=f"ZIP has more than {config.MAX_ZIP_MEMBERS} files")
+    for info in members:
+        if info.file_size > config.MAX_ZIP_MEMBER_BYTES:
+            raise HTTPException(status_code=413, detail=f"{info.filename} is larger than {config.MAX_ZIP_MEMBER_BYTES} bytes")
+    if sum(info.file_size for info in members) > config.MAX_ZIP_TOTAL_BYTES:
+        raise HTTPException(status_code=413, detail=f"ZIP contents are larger than {config.MAX_ZIP_TOTAL_BYTES} bytes")
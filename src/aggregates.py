@@ -0,0 +1,181 @@
+import sys
+import sqlite3
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from langchain_core.documents import Document
+from src.config import Config
+from src.logger import logging as log
+from src.exception import CustomException
+from src.utils import get_approved_amount, get_invoice_month
+
+
+config = Config()
+
+ALL = "*"  # rollup marker for "every employee" / "every month"
+
+
+class ClaimAggregates:
+    """
+    Claim counts and approved amounts per (employee, month, status), kept in SQLite.
+
+    Each stored claim increments four rows: its own (employee, month, status) and the
+    rollups (employee, *, status), (*, month, status) and (*, *, status). Any summary,
+    filtered by employee and/or month or not at all, is then a primary-key read of one
+    row per status, however many invoices are stored.
+
+    Claim ids are written to counted_claims in the same transaction as the counters, so
+    recording a retried batch again does not count its claims twice. Claims stored before
+    the table existed are backfilled from the vector store; the "built" marker is written
+    in the same transaction as that backfill, so an interrupted one is simply redone.
+    """
+
+    def __init__(self, db_path: str = config.AGGREGATES_DB, vector_store=None) -> None:
+        self.db_path = db_path
+        try:
+            with self._connect() as conn:
+                # one API worker creates the tables; the others wait and then find them
+                conn.execute("BEGIN IMMEDIATE")
+                created = not conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'counted_claims'"
+                ).fetchone()
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS claim_aggregates (
+                        employee_name TEXT NOT NULL,
+                        month TEXT NOT NULL,
+                        status TEXT NOT NULL,
+                        claim_count INTEGER NOT NULL DEFAULT 0,
+                        approved_amount REAL NOT NULL DEFAULT 0,
+                        PRIMARY KEY (employee_name, month, status)
+                    )
+                """)
+                conn.execute("CREATE TABLE IF NOT EXISTS counted_claims (claim_id TEXT PRIMARY KEY)")
+                conn.execute("CREATE TABLE IF NOT EXISTS aggregates_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+                if created:
+                    # totals from before counted_claims existed can't be deduplicated; recount them
+                    conn.execute("DELETE FROM claim_aggregates")
+            if vector_store is not None and not self._is_built():
+                self.backfill(vector_store)
+        except Exception as e:
+            raise CustomException(f"Aggregates initialization failed: {e}", sys)
+
+
+    @contextmanager
+    def _connect(self):
+        """Short-lived connection that commits on success; safe across threads and API worker processes"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+
+    def _is_built(self, conn: Optional[sqlite3.Connection] = None) -> bool:
+        if conn is None:
+            with self._connect() as conn:
+                return self._is_built(conn)
+        return conn.execute("SELECT 1 FROM aggregates_meta WHERE key = 'built'").fetchone() is not None
+
+
+    @staticmethod
+    def _mark_built(conn: sqlite3.Connection, counted: int) -> None:
+        conn.execute("INSERT OR REPLACE INTO aggregates_meta (key, value) VALUES ('built', ?)", (str(counted),))
+
+
+    @staticmethod
+    def _fold(conn: sqlite3.Connection, metadatas: List[Dict]) -> int:
+        """Add claims to the counters, skipping claim ids already counted; returns how many were added"""
+        rows = []
+        counted = 0
+        for metadata in metadatas:
+            claim_id = metadata.get("claim_id")
+            if claim_id and not conn.execute(
+                "INSERT OR IGNORE INTO counted_claims (claim_id) VALUES (?)", (claim_id,)
+            ).rowcount:
+                continue
+            counted += 1
+            employee = metadata.get("employee_name", "Unknown")
+            status = metadata.get("status", "unknown")
+            # claims stored before month/approved_amount were added to the metadata
+            month = metadata.get("month") or get_invoice_month(metadata.get("date", "Unknown"))
+            if "approved_amount" in metadata:
+                amount = float(metadata["approved_amount"] or 0.0)
+            else:
+                amount = get_approved_amount(None, metadata.get("reason", ""), status)
+            for employee_key, month_key in ((employee, month), (employee, ALL), (ALL, month), (ALL, ALL)):
+                rows.append((employee_key, month_key, status, amount))
+        conn.executemany("""
+            INSERT INTO claim_aggregates (employee_name, month, status, claim_count, approved_amount)
+            VALUES (?, ?, ?, 1, ?)
+            ON CONFLICT (employee_name, month, status) DO UPDATE SET
+                claim_count = claim_count + 1,
+                approved_amount = approved_amount + excluded.approved_amount
+        """, rows)
+        return counted
+
+
+    def backfill(self, vector_store) -> int:
+        """
+        Count the claims already in the vector store, unless that has been done. Claims
+        recorded meanwhile by other workers are in counted_claims and are skipped.
+        """
+        metadatas = vector_store.metadatas()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if self._is_built(conn):
+                return 0
+            counted = self._fold(conn, metadatas)
+            self._mark_built(conn, counted)
+        log.info(f"Built claim aggregates from {counted} stored claims")
+        return counted
+
+
+    def record(self, documents: List[Document]) -> None:
+        """Fold a freshly stored batch of claim documents into the aggregates in one transaction"""
+        if not documents:
+            return
+        try:
+            with self._connect() as conn:
+                counted = self._fold(conn, [document.metadata for document in documents])
+            log.info(f"Recorded {counted} of {len(documents)} claims in aggregates (the rest were already counted)")
+        except Exception as e:
+            raise CustomException(f"Error while updating aggregates: {e}", sys)
+
+
+    def rebuild(self, vector_store) -> int:
+        """Replace every total with a recount of the vector store's metadata, read once; returns the claim count"""
+        try:
+            metadatas = vector_store.metadatas()
+            with self._connect() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute("DELETE FROM claim_aggregates")
+                conn.execute("DELETE FROM counted_claims")
+                counted = self._fold(conn, metadatas)
+                self._mark_built(conn, counted)
+            log.info(f"Rebuilt claim aggregates from {counted} stored claims")
+            return counted
+        except Exception as e:
+            raise CustomException(f"Error while rebuilding aggregates: {e}", sys)
+
+
+    def summary(self, employee_name: Optional[str] = None, month: Optional[str] = None) -> Dict:
+        """Claim counts and approved amounts by status for an employee and/or month (or overall)"""
+        employee_key = employee_name or ALL
+        month_key = month or ALL
+        try:
+            with self._connect() as conn:
+                rows = conn.execute("""
+                    SELECT status, claim_count, approved_amount FROM claim_aggregates
+                    WHERE employee_name = ? AND month = ?
+                """, (employee_key, month_key)).fetchall()
+        except Exception as e:
+            raise CustomException(f"Error while reading aggregates: {e}", sys)
+
+        by_status = {status: {"claims": count, "approved_amount": amount} for status, count, amount in rows}
+        return {
+            "employee_name": employee_name,
+            "month": month,
+            "total_claims": sum(item["claims"] for item in by_status.values()),
+            "total_approved_amount": sum(item["approved_amount"] for item in by_status.values()),
+            "by_status": by_status
+        }
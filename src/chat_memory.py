@@ -0,0 +1,160 @@
+import sys
+import json
+import time
+import sqlite3
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from langchain_core.messages import BaseMessage, trim_messages
+from langchain_core.messages.utils import count_tokens_approximately
+from src.config import Config
+from src.logger import logging as log
+from src.exception import CustomException
+
+
+config = Config()
+
+# tables written by langgraph's SqliteSaver
+CHECKPOINT_TABLES = ("checkpoints", "writes")
+
+
+def trim_to_budget(messages: List[BaseMessage], max_tokens: int = config.CHAT_TOKEN_BUDGET) -> List[BaseMessage]:
+    """Keep the most recent messages that fit in the chat token budget, starting on a human turn."""
+    trimmed = trim_messages(
+        messages,
+        max_tokens=max_tokens,
+        strategy="last",
+        token_counter=count_tokens_approximately,
+        start_on="human",
+        include_system=True,
+    )
+    # a single oversized question still has to be sent
+    return trimmed or messages[-1:]
+
+
+def history_overflow(messages: List[BaseMessage], max_messages: int = config.CHAT_MAX_MESSAGES) -> List[BaseMessage]:
+    """Oldest messages to drop so at most max_messages remain and the history starts on a human turn."""
+    start = max(len(messages) - max_messages, 0)
+    while start < len(messages) and messages[start].type != "human":
+        start += 1
+    if start >= len(messages):
+        return []
+    return messages[:start]
+
+
+class RetrievalCache:
+    """
+    Serialized retrieval results of one session, keyed by tool name and arguments.
+
+    Entries are least recently used first, so the oldest is evicted past `max_size`. They
+    are only reused while the vector store is at the version they were retrieved at;
+    any ingest, archive or restore starts the session over with an empty cache.
+    """
+
+    def __init__(self, entries: Optional[Dict[str, str]], filled_at: Optional[str], version: str,
+                 max_size: int = config.CHAT_RETRIEVAL_CACHE_SIZE) -> None:
+        self.version = version
+        self.max_size = max_size
+        self.entries = dict(entries or {}) if filled_at == version else {}
+
+
+    @staticmethod
+    def key(tool_call: Dict) -> str:
+        return json.dumps([tool_call["name"], tool_call["args"]], sort_keys=True, default=str)
+
+
+    def get(self, key: str) -> Optional[str]:
+        if key not in self.entries:
+            return None
+        self.entries[key] = self.entries.pop(key)  # mark as most recently used
+        return self.entries[key]
+
+
+    def put(self, key: str, content: str) -> None:
+        self.entries.pop(key, None)
+        self.entries[key] = content
+        while len(self.entries) > self.max_size:
+            self.entries.pop(next(iter(self.entries)))
+
+
+class ChatMemory:
+    """
+    Keeps the chat checkpoint database bounded.
+
+    SqliteSaver stores a checkpoint for every step of every session. After each turn
+    only the latest checkpoint of the session is kept (it holds the full, already
+    trimmed state), and sessions idle for longer than `ttl_seconds` are deleted.
+    """
+
+    def __init__(self, db_path: str = config.CHAT_MEMORY_DB, ttl_seconds: int = config.CHAT_SESSION_TTL_SECONDS,
+                 expire_every_seconds: int = 300) -> None:
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.expire_every_seconds = expire_every_seconds
+        self.last_expired = 0.0
+        try:
+            with self._connect() as conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS chat_sessions (
+                        thread_id TEXT PRIMARY KEY,
+                        last_used REAL NOT NULL
+                    )
+                """)
+        except Exception as e:
+            raise CustomException(f"Chat memory initialization failed: {e}", sys)
+
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+
+    @staticmethod
+    def _checkpoint_tables(conn: sqlite3.Connection) -> List[str]:
+        """Checkpoint tables that exist yet (SqliteSaver creates them on first use)"""
+        existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        return [table for table in CHECKPOINT_TABLES if table in existing]
+
+
+    def after_turn(self, thread_id: str) -> None:
+        """Mark the session as used, drop its superseded checkpoints and expire idle sessions"""
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute("""
+                    INSERT INTO chat_sessions (thread_id, last_used) VALUES (?, ?)
+                    ON CONFLICT (thread_id) DO UPDATE SET last_used = excluded.last_used
+                """, (thread_id, now))
+                for table in self._checkpoint_tables(conn):
+                    # checkpoint ids are time-ordered, so everything below the newest one is history
+                    conn.execute(f"""
+                        DELETE FROM {table} WHERE thread_id = ? AND checkpoint_id < (
+                            SELECT MAX(checkpoint_id) FROM checkpoints AS latest
+                            WHERE latest.thread_id = {table}.thread_id AND latest.checkpoint_ns = {table}.checkpoint_ns
+                        )
+                    """, (thread_id,))
+            if now - self.last_expired >= self.expire_every_seconds:
+                self.expire(now)
+        except Exception as e:
+            raise CustomException(f"Error while pruning chat memory: {e}", sys)
+
+
+    def expire(self, now: Optional[float] = None) -> int:
+        """Delete every session idle for longer than the TTL; returns how many were removed"""
+        now = now or time.time()
+        self.last_expired = now
+        with self._connect() as conn:
+            expired = [row[0] for row in conn.execute(
+                "SELECT thread_id FROM chat_sessions WHERE last_used < ?", (now - self.ttl_seconds,)
+            )]
+            for thread_id in expired:
+                for table in self._checkpoint_tables(conn):
+                    conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+                conn.execute("DELETE FROM chat_sessions WHERE thread_id = ?", (thread_id,))
+        if expired:
+            log.info(f"Expired {len(expired)} idle chat sessions")
+        return len(expired)
@@ -14,4 +14,37 @@ class Config:
     SEARCH_CONFIG = {"k": 1, "score_threshold": 0.5}
     VECTOR_STORE_DIR = "./vectorDB"
     DB_NAME = "invoice_analysis_report"
+    # float32 | float16 | int8: precision of the in-memory search index. Reduces search memory only;
+    # Chroma still stores float32 on disk, so disk use grows by the index files
+    EMBEDDING_PRECISION = os.getenv("EMBEDDING_PRECISION", "float32")
+    RESCORE_FACTOR = 4  # candidates fetched per result for full-precision rescoring
+    PARTITION_BY = os.getenv("PARTITION_BY", "none")  # none | month | tenant
+    TENANT_FIELD = "employee_name"
+    SEARCH_WORKERS = 4  # threads used to fan a search out across partitions
+    INGESTION_MODE = os.getenv("INGESTION_MODE", "local")  # local | proxy
+    INGESTION_ADDRESS = (os.getenv("INGESTION_HOST", "127.0.0.1"), int(os.getenv("INGESTION_PORT", "50055")))
+    # The writer unpickles whatever authenticated clients send, so there is no default key
+    INGESTION_AUTHKEY = os.getenv("INGESTION_AUTHKEY")
+    INGESTION_ALLOW_REMOTE = os.getenv("INGESTION_ALLOW_REMOTE", "false").lower() == "true"  # opt-in for non-loopback hosts
+    CHAT_MEMORY_DB = "./chat_memory.sqlite3"
+    CHAT_TOKEN_BUDGET = 3000  # approximate tokens of conversation sent to the LLM per call
+    CHAT_MAX_MESSAGES = 20  # messages kept in a session's checkpointed state
+    CHAT_RETRIEVAL_CACHE_SIZE = 16  # retrievals reused per session
+    CHAT_SESSION_TTL_SECONDS = 7 * 24 * 3600  # idle sessions are deleted from chat memory after this
+    AGGREGATES_DB = "./claim_aggregates.sqlite3"
+    MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 50 * 1024 * 1024))
+    MAX_ZIP_MEMBERS = 500
+    MAX_ZIP_MEMBER_BYTES = 10 * 1024 * 1024  # uncompressed size of any one file in the invoice ZIP
+    MAX_ZIP_TOTAL_BYTES = 200 * 1024 * 1024  # uncompressed size of the whole invoice ZIP
+    MAX_REQUEST_BYTES = int(os.getenv("MAX_REQUEST_BYTES", 2 * MAX_UPLOAD_BYTES + 1024 * 1024))  # whole multipart body
+    # per-endpoint admission: concurrent requests, bounded wait queue, max seconds queued,
+    # and requests per minute allowed for each client. Gates live in each API process, so these
+    # totals are split across API_WORKERS (set it to uvicorn's --workers; each gets at least 1)
+    API_WORKERS = int(os.getenv("API_WORKERS", 1))
+    # header a reverse proxy puts the client address in (e.g., X-Forwarded-For); unset = socket peer
+    CLIENT_ID_HEADER = os.getenv("CLIENT_ID_HEADER")
+    ADMISSION_LIMITS = {
+        "process_claim": {"concurrency": 2, "queue_size": 4, "queue_timeout": 30, "client_quota": 10},
+        "chat": {"concurrency": 8, "queue_size": 32, "queue_timeout": 10, "client_quota": 60},
+    }
 
@@ -8,6 +8,7 @@ def LLM_prompt_template(invoice_text: str, policy_text: str) -> dict:
     "customer_name": "Customer Name here",
     "reimbursement_status": "accept | partially accept | reject",
     "reason": "Detailed explanation with Specific policy clauses and Approved Amount here",
+    "approved_amount": "Approved amount as a plain number, 0 if rejected",
     "date": "Invoice Date Here",
     "invoice_ID": "Invoice ID Here",
     "invoice_text": "specify invoice text content here"
@@ -27,6 +28,7 @@ Important Rules:
 5. First Name, Second Name and Thrid Name will all strat with a capital Letter.
 6. Take care of extra spaces within the first Name. DO not break first name into parts (second name will start with a capital letter) for example **A njane y a K** is **Anjaneya K**
 7. Ensure the 'reason' field in the JSON does not contain unescaped quotes or special characters.
+8. "approved_amount" must be only the number (no currency symbol, no commas), for example 1250.50
 
 Take care of some broken words:
 1. **Cust omer Name** is **Customer Name**
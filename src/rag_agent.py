@@ -1,8 +1,13 @@
+import sqlite3
 from langgraph.graph import MessagesState, StateGraph, END
 from langchain_core.tools import tool
-from langchain_core.messages import SystemMessage
+from langchain_core.messages import SystemMessage, ToolMessage, RemoveMessage
 from langgraph.prebuilt import ToolNode, tools_condition
-from src.vector_store.db import VectorStore
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.config import get_config
+from src.chat_memory import RetrievalCache, trim_to_budget, history_overflow
+from src.vector_store.ingestion import get_vector_store
+from src.config import Config
 from typing import Dict
 from langchain import hub
 from langchain_community.document_loaders import WebBaseLoader
@@ -13,9 +18,17 @@ from typing_extensions import List, TypedDict
 from langchain.chat_models import init_chat_model
 
 
-vector_store = VectorStore()
+class ChatState(MessagesState):
+    # serialized retrieval results keyed by tool name and arguments, reused across turns of a session
+    retrieval_cache: Dict[str, str]
+    # vector store version the cache was filled at; a new ingest invalidates it
+    retrieval_version: str
+
+
+config = Config()
+vector_store = get_vector_store()
 retriever = vector_store.as_retriever(search_type="similarity")
-graph_builder = StateGraph(MessagesState)
+graph_builder = StateGraph(ChatState)
 llm = init_chat_model("llama3-8b-8192", model_provider="groq")
 prompt = hub.pull("rlm/rag-prompt")
 
@@ -41,20 +54,52 @@ def retrieve(query: str, metadata_filter: dict = None):
 
 
 # Step 1: Generate an AIMessage that may include a tool-call to be sent.
-def query_or_respond(state: MessagesState):
+def query_or_respond(state: ChatState):
     """Generate tool call for retrieval or respond."""
     llm_with_tools = llm.bind_tools([retrieve])
-    response = llm_with_tools.invoke(state["messages"])
+    response = llm_with_tools.invoke(trim_to_budget(state["messages"]))
     # MessagesState appends messages to state instead of overwriting
     return {"messages": [response]}
 
 
-# Step 2: Execute the retrieval.
-tools = ToolNode([retrieve])
+# Step 2: Execute the retrieval, reusing results already retrieved in this session.
+tool_node = ToolNode([retrieve], handle_tool_errors=True)
+
+
+def tools(state: ChatState):
+    """Run requested tool calls through the ToolNode, answering repeated retrievals from the session cache."""
+    cache = RetrievalCache(state.get("retrieval_cache"), state.get("retrieval_version"), vector_store.version())
+    tool_calls = state["messages"][-1].tool_calls
+    keys = {tool_call["id"]: RetrievalCache.key(tool_call) for tool_call in tool_calls}
+
+    results = {}
+    pending = []
+    for tool_call in tool_calls:
+        cached = cache.get(keys[tool_call["id"]]) if tool_call["name"] == retrieve.name else None
+        if cached is not None:
+            results[tool_call["id"]] = ToolMessage(content=cached, name=tool_call["name"], tool_call_id=tool_call["id"])
+        else:
+            pending.append(tool_call)
+
+    if pending:
+        # ToolNode turns bad arguments, tool errors and unknown tool names into error ToolMessages;
+        # it needs this run's config (callbacks, store) when invoked from inside a node
+        request = state["messages"][-1].model_copy(update={"tool_calls": pending})
+        for message in tool_node.invoke({"messages": [request]}, get_config())["messages"]:
+            results[message.tool_call_id] = message
+            ok = message.status != "error" and not str(message.content).startswith("Retrieval failed")
+            if message.name == retrieve.name and ok:
+                cache.put(keys[message.tool_call_id], message.content)
+
+    return {
+        "messages": [results[tool_call["id"]] for tool_call in tool_calls if tool_call["id"] in results],
+        "retrieval_cache": cache.entries,
+        "retrieval_version": cache.version
+    }
 
 
 # Step 3: Generate a response using the retrieved content.
-def generate(state: MessagesState):
+def generate(state: ChatState):
     """Generate answer."""
     # Get generated ToolMessages
     recent_tool_messages = []
@@ -82,23 +127,35 @@ def generate(state: MessagesState):
         if message.type in ("human", "system")
         or (message.type == "ai" and not message.tool_calls)
     ]
-    prompt = [SystemMessage(system_message_content)] + conversation_messages
+    prompt = [SystemMessage(system_message_content)] + trim_to_budget(conversation_messages)
 
     # Run
     response = llm.invoke(prompt)
     return {"messages": [response]}
 
+
+# Step 4: Bound the stored session so checkpoints don't grow with every turn.
+def trim_history(state: ChatState):
+    """Drop the oldest messages beyond CHAT_MAX_MESSAGES, keeping the history starting on a human turn."""
+    return {"messages": [RemoveMessage(id=message.id) for message in history_overflow(state["messages"])]}
+
+
 graph_builder.add_node(query_or_respond)
 graph_builder.add_node(tools)
 graph_builder.add_node(generate)
+graph_builder.add_node(trim_history)
 
 graph_builder.set_entry_point("query_or_respond")
 graph_builder.add_conditional_edges(
     "query_or_respond",
     tools_condition,
-    {END: END, "tools": "tools"},
+    {END: "trim_history", "tools": "tools"},
 )
 graph_builder.add_edge("tools", "generate")
-graph_builder.add_edge("generate", END)
+graph_builder.add_edge("generate", "trim_history")
+graph_builder.add_edge("trim_history", END)
 
-graph = graph_builder.compile()
+# Session state is checkpointed per thread_id in a local SQLite file shared by all API workers;
+# src.chat_memory.ChatMemory prunes superseded checkpoints and expires idle sessions
+memory = SqliteSaver(sqlite3.connect(config.CHAT_MEMORY_DB, check_same_thread=False))
+graph = graph_builder.compile(checkpointer=memory)
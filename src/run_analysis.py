@@ -66,7 +66,7 @@ class InvoicePolicyComparator:
                 else:
                     return {"error": "No valid JSON found", "raw_response": content}
 
-            required_fields = ["customer_name", "reimbursement_status", "reason", "date", "invoice_ID", "policy_references"]
+            required_fields = ["customer_name", "reimbursement_status", "reason", "date", "invoice_ID", "approved_amount", "policy_references"]
             for field in required_fields:
                 if field not in result:
                     result[field] = "Unknown"  # providing default values to avoid failure
@@ -1,9 +1,20 @@
 from langchain_core.documents import Document
 from typing import List
 from src.logger import logging as log
+from datetime import datetime
+import hashlib
 import re
 
 
+# Day-first numeric formats come before their month-first counterparts, so 05/03/2024 is 5 March;
+# month-first only matches when the day-first reading is impossible (e.g., 03/25/2024)
+DATE_FORMATS = ("%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%d/%m/%y", "%d-%m-%y",
+                "%m/%d/%Y", "%m-%d-%Y", "%m/%d/%y",
+                "%Y-%m-%d", "%Y/%m/%d",
+                "%d %B %Y", "%d %b %Y", "%d-%B-%Y", "%d-%b-%Y", "%d-%b-%y",
+                "%B %d, %Y", "%b %d, %Y", "%B %d %Y", "%b %d %Y", "%d %B, %Y", "%d %b, %Y")
+
+
 def get_data_to_embed(decisions: List[dict], invoice_texts: List[str]) -> List[Document]:
     """
     Converts analysis decisions and invoice texts into LangChain Documents for vector storage
@@ -27,19 +38,22 @@ def get_data_to_embed(decisions: List[dict], invoice_texts: List[str]) -> List[D
             status = decision.get("reimbursement_status", "unknown").lower()
             reason = decision.get("reason", "No reason provided")
             name = decision.get("customer_name", "Unknown")
-            if name != "Unknown":
-                employee_name = get_correct_name(name)
+            employee_name = get_correct_name(name) if name != "Unknown" else name
             
             # Prepare document content
             text_to_embed = f"Invoice Content: {invoice_text}, Status: {status}, Reason: {reason}"
             
             # Prepare metadata
             metadata = {
+                # same invoice, same id, so re-submitting a claim does not store or count it twice
+                "claim_id": hashlib.sha256(str(invoice_text).encode("utf-8")).hexdigest(),
                 "invoice_id": decision.get("invoice_ID", "unknown"),
                 "status": status,
                 "reason": reason,
                 "employee_name": employee_name,
-                "date": decision.get("date", "Unknown")
+                "date": decision.get("date", "Unknown"),
+                "month": get_invoice_month(decision.get("date", "Unknown")),
+                "approved_amount": get_approved_amount(decision.get("approved_amount"), reason, status)
             }
             
             # Creating Langchain Document
@@ -111,4 +125,52 @@ def get_correct_name(broken_name: str)->str:
     name = possible_name.split()
     if len(name)>2:
         return ' '.join(name[:2])
-    return possible_name
\ No newline at end of file
+    return possible_name
+
+
+def get_invoice_month(date: str) -> str:
+    '''
+    Normalises an invoice date as written by the LLM (e.g., 12/03/2024, 03/25/2024, 12-Mar-2024,
+    2024-03-12T10:30:00) to its month. Numeric dates are read day-first, falling back to
+    month-first only when the day-first reading is not a valid date. A trailing time is ignored.
+
+    Param: date: invoice date string
+
+    Returns: "YYYY-MM", or "unknown" if the date cannot be parsed'''
+    date = re.sub(r'\s+', ' ', str(date)).strip()
+    # drop a time part such as "T10:30:00" or " 10:30 AM"
+    date_only = re.split(r'[T ]\d{1,2}:\d{2}', date)[0].strip()
+    for candidate in dict.fromkeys((date, date_only)):
+        for date_format in DATE_FORMATS:
+            try:
+                return datetime.strptime(candidate, date_format).strftime("%Y-%m")
+            except ValueError:
+                continue
+    return "unknown"
+
+
+def get_approved_amount(approved_amount, reason: str, status: str) -> float:
+    '''
+    Reads the approved amount from the decision's structured "approved_amount" field (e.g., 1250.5,
+    "1,250.50", "Rs. 1250"). Only when that field is missing or holds no number is the amount pulled
+    out of the LLM's reason (e.g., "... Approved Amount: Rs. 1,250.50"). Rejected claims are always 0.
+
+    Param: approved_amount: "approved_amount" field of the analysis decision
+           reason: reason text from the analysis decision
+           status: reimbursement status (accept | partially accept | reject)
+
+    Returns: approved amount, or 0.0 if none is stated'''
+    if status == "reject":
+        return 0.0
+    if isinstance(approved_amount, (int, float)) and not isinstance(approved_amount, bool):
+        return max(float(approved_amount), 0.0)
+    match = re.search(r'\d[\d,]*(?:\.\d+)?', str(approved_amount or ""))
+    if not match:
+        # fallback for decisions without the structured field; percentages are not amounts
+        match = re.search(r'approved\s+amount[^0-9]{0,20}?(\d[\d,]*(?:\.\d+)?)(?![\d,.]*\s*%)', str(reason), re.IGNORECASE)
+    if not match:
+        return 0.0
+    try:
+        return float(match.group(match.lastindex or 0).replace(",", ""))
+    except ValueError:
+        return 0.0
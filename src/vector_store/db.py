@@ -1,25 +1,349 @@
+import os
+import sys
+import json
+import threading
+import numpy as np
+from uuid import uuid4
+from concurrent.futures import ThreadPoolExecutor
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_chroma import Chroma
+from langchain_core.retrievers import BaseRetriever
 from src.config import Config
-from typing import List, Optional, Dict
+from typing import Any, List, Optional, Dict, Tuple
 from langchain_core.documents import Document
 from src.logger import logging as log
 from src.exception import CustomException
+from src.vector_store.quantization import QuantizedIndex, SUPPORTED_PRECISIONS, TAIL_SUFFIX
+from src.vector_store.partitioning import (PARTITION_SCHEMES, partition_key, collection_name,
+                                           select_partitions)
 
 
 config = Config()
 
+REBUILD_BATCH_SIZE = 1000
+
+
+class Collection:
+    """One Chroma collection together with its optional quantized index"""
+
+    def __init__(self, name: str, embeddings: HuggingFaceEmbeddings, db_path: str, precision: str) -> None:
+        self.name = name
+        self.precision = precision
+        self.vector_store = Chroma(
+            collection_name=name,
+            embedding_function=embeddings,
+            persist_directory=db_path
+        )
+        self.index_path = os.path.join(db_path, f"{name}.{precision}.npz")
+        self.vectors_path = os.path.join(db_path, f"{name}.float32.bin")
+        self.index = self._load_index() if precision != "float32" else None
+
+
+    def _load_index(self) -> QuantizedIndex:
+        """
+        Load the quantized index from disk, rebuilding it from ChromaDB if it is stale.
+
+        The staleness check only lists ids, so a normal start-up never reads Chroma's
+        float32 vectors; only a rebuild does, in batches.
+        """
+        index = QuantizedIndex.load(self.index_path, self.precision, self.vectors_path)
+        stored_ids = self.vector_store.get(include=[])["ids"]
+        if index is not None and set(index.ids) == set(stored_ids):
+            log.info(f"Loaded {self.precision} index for {self.name} with {len(index)} vectors")
+            return index
+
+        log.info(f"Rebuilding {self.precision} index for {self.name} from {len(stored_ids)} stored vectors")
+        for path in (self.vectors_path, self.index_path, self.index_path + TAIL_SUFFIX):
+            if os.path.exists(path):
+                os.remove(path)
+        index = QuantizedIndex(self.precision, self.vectors_path)
+        index.add_batches(
+            (data["ids"], data["embeddings"])
+            for data in (
+                self.vector_store.get(include=["embeddings"], limit=REBUILD_BATCH_SIZE, offset=offset)
+                for offset in range(0, len(stored_ids), REBUILD_BATCH_SIZE)
+            )
+        )
+        if len(index):
+            index.save(self.index_path)
+        return index
+
+
+    def add_documents(self, documents: List[Document], ids: Optional[List[str]] = None,
+                      vectors: Optional[List[List[float]]] = None) -> None:
+        """
+        Store documents; ids and already computed vectors can be passed in (e.g., when migrating).
+        Ids default to each document's claim_id, and ids that are already stored are skipped, so
+        a retried batch (or an invoice repeated within a batch) is not stored twice.
+        """
+        if not documents:
+            return
+        ids = ids or [document.metadata.get("claim_id") or str(uuid4()) for document in documents]
+        seen = set(self.vector_store.get(ids=ids, include=[])["ids"])
+        keep = []
+        for i, doc_id in enumerate(ids):
+            if doc_id not in seen:
+                seen.add(doc_id)
+                keep.append(i)
+        if len(keep) < len(ids):
+            log.info(f"Skipping {len(ids) - len(keep)} documents already stored in {self.name}")
+            documents = [documents[i] for i in keep]
+            ids = [ids[i] for i in keep]
+            vectors = [vectors[i] for i in keep] if vectors is not None else None
+            if not documents:
+                return
+        if self.index is None and vectors is None:
+            self.vector_store.add_documents(documents, ids=ids)
+            return
+        # Embed once here so the index gets the vectors without reading them back from Chroma
+        texts = [document.page_content for document in documents]
+        if vectors is None:
+            vectors = self.vector_store.embeddings.embed_documents(texts)
+        self.vector_store._collection.add(
+            ids=ids,
+            embeddings=vectors,
+            documents=texts,
+            metadatas=[document.metadata for document in documents]
+        )
+        if self.index is not None:
+            self.index.add(ids, vectors)
+            self.index.persist(self.index_path)
+
+
+    def search(self, query_vector: List[float], k: int, metadata_filter: Optional[Dict] = None) -> List[Tuple[Document, float]]:
+        """Returns (document, score) pairs, higher score = more similar"""
+        if self.index is None:
+            results = self.vector_store.similarity_search_by_vector_with_relevance_scores(
+                embedding=query_vector,
+                k=k,
+                filter=metadata_filter
+            )
+            # Chroma returns distances; negate so scores from every partition sort the same way
+            return [(doc, -distance) for doc, distance in results]
+        return self._quantized_search(query_vector, k, metadata_filter)
+
+
+    def _quantized_search(self, query_vector: List[float], k: int, metadata_filter: Optional[Dict] = None) -> List[Tuple[Document, float]]:
+        """Shortlist candidates from the quantized index, then rescore them at full precision"""
+        allowed_ids = None
+        if metadata_filter:
+            allowed_ids = set(self.vector_store.get(where=metadata_filter, include=[])["ids"])
+            if not allowed_ids:
+                return []
+
+        candidates = self.index.search(query_vector, k * config.RESCORE_FACTOR, allowed_ids)
+        if not candidates:
+            return []
+
+        # Rescoring reads the memory-mapped float32 file; Chroma only supplies documents and metadata
+        top = self.index.rescore(query_vector, [doc_id for doc_id, _ in candidates], k)
+        stored = self.vector_store.get(ids=[doc_id for doc_id, _ in top], include=["documents", "metadatas"])
+        found = {doc_id: i for i, doc_id in enumerate(stored["ids"])}
+        return [
+            (Document(page_content=stored["documents"][found[doc_id]], metadata=stored["metadatas"][found[doc_id]] or {}), score)
+            for doc_id, score in top if doc_id in found
+        ]
+
+
+class SimilarityRetriever(BaseRetriever):
+    """Plain similarity retriever over any store exposing similarity_search (e.g., a partitioned VectorStore)"""
+    store: Any
+    k: int = 4
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        return self.store.similarity_search(query, k=self.k)
+
+
 class VectorStore:
-    def __init__(self, db_path: str = config.VECTOR_STORE_DIR) -> None:
+    def __init__(self, db_path: str = config.VECTOR_STORE_DIR, precision: str = config.EMBEDDING_PRECISION,
+                 partition_by: str = config.PARTITION_BY) -> None:
         try:
+            if precision not in SUPPORTED_PRECISIONS:
+                raise ValueError(f"precision must be one of {SUPPORTED_PRECISIONS}, got {precision}")
+            if partition_by not in PARTITION_SCHEMES:
+                raise ValueError(f"partition_by must be one of {PARTITION_SCHEMES}, got {partition_by}")
+            self.db_path = db_path
+            self.precision = precision
+            self.partition_by = partition_by
             self.embeddings = HuggingFaceEmbeddings(model_name=config.EMBEDDING_MODEL)
-            self.vector_store = Chroma(
-                collection_name=config.DB_NAME,
-                embedding_function=self.embeddings,
-                persist_directory=db_path
-            )
+            self.collections: Dict[str, Collection] = {}
+            # searches run concurrently with writes in the ingestion writer; this guards
+            # self.partitions, self.collections and the manifest file
+            self.partitions_lock = threading.RLock()
+            self.version_path = os.path.join(db_path, f"{config.DB_NAME}.version")
+            self._version = self._read_version()
+
+            if partition_by == "none":
+                self.default = Collection(config.DB_NAME, self.embeddings, db_path, precision)
+                self.vector_store = self.default.vector_store
+            else:
+                self.manifest_path = os.path.join(db_path, f"{config.DB_NAME}.partitions.json")
+                self.partitions = self._load_manifest()
+                self.executor = ThreadPoolExecutor(max_workers=config.SEARCH_WORKERS)
+                self._warn_about_legacy_collection()
         except Exception as e:
-            raise CustomException(f"VectorStore initialization failed: {e}", e)
+            raise CustomException(f"VectorStore initialization failed: {e}", sys)
+
+
+    @property
+    def partitioned(self) -> bool:
+        return self.partition_by != "none"
+
+
+    def _read_version(self) -> str:
+        if not os.path.exists(self.version_path):
+            return "0"
+        with open(self.version_path, "r") as f:
+            return f.read().strip() or "0"
+
+
+    def _bump_version(self) -> None:
+        self._version = uuid4().hex
+        os.makedirs(self.db_path, exist_ok=True)
+        with open(self.version_path, "w") as f:
+            f.write(self._version)
+
+
+    def version(self) -> str:
+        """Token that changes whenever the searchable data changes (e.g., to invalidate cached retrievals)"""
+        return self._version
+
+
+    def _load_manifest(self) -> Dict[str, Dict]:
+        """Partition key -> {"collection": name, "archived": bool}"""
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path, "r") as f:
+            return json.load(f)
+
+
+    def _save_manifest(self) -> None:
+        os.makedirs(self.db_path, exist_ok=True)
+        with open(self.manifest_path, "w") as f:
+            json.dump(self.partitions, f, indent=2)
+
+
+    def _legacy_collection(self) -> Chroma:
+        """The single, unpartitioned collection used before PARTITION_BY was turned on"""
+        return Chroma(
+            collection_name=config.DB_NAME,
+            embedding_function=self.embeddings,
+            persist_directory=self.db_path
+        )
+
+
+    def _warn_about_legacy_collection(self) -> None:
+        legacy_count = self._legacy_collection()._collection.count()
+        if legacy_count:
+            message = (f"{legacy_count} documents are still in the unpartitioned collection {config.DB_NAME} "
+                       f"and are not searched with PARTITION_BY={self.partition_by}; "
+                       f"run `python -m src.vector_store.db migrate` to move them into partitions")
+            log.warning(message)
+
+
+    def migrate_legacy_collection(self) -> int:
+        """
+        One-off move of every document in the unpartitioned collection into its partition.
+
+        Stored embeddings and ids are reused, so nothing is re-embedded and re-running after
+        an interruption skips documents that were already moved. The legacy collection is
+        deleted once everything has been copied.
+        """
+        if not self.partitioned:
+            raise ValueError("migrate_legacy_collection needs PARTITION_BY set to month or tenant")
+        legacy = self._legacy_collection()
+        total = legacy._collection.count()
+        moved = 0
+        for offset in range(0, total, REBUILD_BATCH_SIZE):
+            batch = legacy.get(include=["documents", "metadatas", "embeddings"], limit=REBUILD_BATCH_SIZE, offset=offset)
+            groups: Dict[str, List[int]] = {}
+            for i, metadata in enumerate(batch["metadatas"]):
+                groups.setdefault(partition_key(self.partition_by, metadata or {}), []).append(i)
+            for key, rows in groups.items():
+                collection = self._collection(key)
+                existing = set(collection.vector_store.get(ids=[batch["ids"][i] for i in rows], include=[])["ids"])
+                rows = [i for i in rows if batch["ids"][i] not in existing]
+                if not rows:
+                    continue
+                collection.add_documents(
+                    [Document(page_content=batch["documents"][i], metadata=batch["metadatas"][i] or {}) for i in rows],
+                    ids=[batch["ids"][i] for i in rows],
+                    vectors=[list(batch["embeddings"][i]) for i in rows]
+                )
+                moved += len(rows)
+        legacy.delete_collection()
+        self._bump_version()
+        log.info(f"Migrated {moved} of {total} legacy documents into partitions")
+        return moved
+
+
+    def partition_key(self, metadata: Dict) -> str:
+        return partition_key(self.partition_by, metadata)
+
+
+    def _collection(self, key: str) -> Collection:
+        """Opens (and registers, if new) the collection backing a partition"""
+        with self.partitions_lock:
+            if key not in self.partitions:
+                name = collection_name(key, {p["collection"] for p in self.partitions.values()})
+                self.partitions[key] = {"collection": name, "archived": False}
+                self._save_manifest()
+                log.info(f"Created partition {key} -> {name}")
+            if key not in self.collections:
+                self.collections[key] = Collection(self.partitions[key]["collection"], self.embeddings, self.db_path, self.precision)
+            return self.collections[key]
+
+
+    def partitions_for(self, metadata_filter: Optional[Dict] = None, include_archived: bool = False) -> List[str]:
+        """Partitions a search with this filter has to touch"""
+        with self.partitions_lock:
+            partitions = {key: dict(partition) for key, partition in self.partitions.items()}
+        return select_partitions(partitions, self.partition_by, metadata_filter, include_archived)
+
+
+    def list_partitions(self) -> Dict[str, Dict]:
+        if not self.partitioned:
+            return {}
+        with self.partitions_lock:
+            return {key: dict(partition) for key, partition in self.partitions.items()}
+
+
+    def metadatas(self) -> List[Dict]:
+        """Metadata of every stored document, archived partitions included; read in batches, no embeddings"""
+        if self.partitioned:
+            with self.partitions_lock:
+                names = [partition["collection"] for partition in self.partitions.values()]
+        else:
+            names = [config.DB_NAME]
+        metadatas = []
+        for name in names:
+            store = Chroma(collection_name=name, embedding_function=self.embeddings, persist_directory=self.db_path)
+            for offset in range(0, store._collection.count(), REBUILD_BATCH_SIZE):
+                batch = store.get(include=["metadatas"], limit=REBUILD_BATCH_SIZE, offset=offset)
+                metadatas.extend(metadata or {} for metadata in batch["metadatas"])
+        return metadatas
+
+
+    def archive_partition(self, key: str) -> None:
+        """Exclude a partition from searches and release its collection; its data stays on disk"""
+        if not self.partitioned or key not in self.partitions:
+            raise ValueError(f"Unknown partition: {key}")
+        with self.partitions_lock:
+            self.partitions[key]["archived"] = True
+            self.collections.pop(key, None)
+            self._save_manifest()
+            self._bump_version()
+        log.info(f"Archived partition {key}")
+
+
+    def restore_partition(self, key: str) -> None:
+        if not self.partitioned or key not in self.partitions:
+            raise ValueError(f"Unknown partition: {key}")
+        with self.partitions_lock:
+            self.partitions[key]["archived"] = False
+            self._save_manifest()
+            self._bump_version()
+        log.info(f"Restored partition {key}")
 
 
     def add_documents(self, documents: List[Document]) -> None:
@@ -27,30 +351,144 @@ class VectorStore:
         log.info(f"Adding docs to chromaDB::length={len(documents)}")
         try:
             log.info(f"Adding {len(documents)} documents to ChromaDB.")
-            self.vector_store.add_documents(documents)
+            if not self.partitioned:
+                self.default.add_documents(documents)
+            else:
+                groups: Dict[str, List[Document]] = {}
+                for document in documents:
+                    groups.setdefault(self.partition_key(document.metadata), []).append(document)
+                for key, group in groups.items():
+                    if self.partitions.get(key, {}).get("archived"):
+                        # a late invoice for an archived month must stay searchable
+                        log.warning(f"Restoring archived partition {key} to add {len(group)} documents")
+                        self.restore_partition(key)
+                    self._collection(key).add_documents(group)
+            self._bump_version()
         except Exception as e:
-            raise CustomException(f"Error while adding documents: {e}", e)
-        
-        
-    def similarity_search(self, query: str, k: int = 4, metadata_filter: Optional[Dict] = None) -> List[Document]:
+            raise CustomException(f"Error while adding documents: {e}", sys)
+
+
+    def similarity_search(self, query: str, k: int = 4, metadata_filter: Optional[Dict] = None,
+                          include_archived: bool = False) -> List[Document]:
         """Search for similar documents"""
         try:
             log.info(f"Performing similarity search with query: {query}")
-            return self.vector_store.similarity_search(
-                query=query,
-                k=k,
-                filter=metadata_filter
-            )
+            if not self.partitioned:
+                if self.default.index is None:
+                    return self.vector_store.similarity_search(
+                        query=query,
+                        k=k,
+                        filter=metadata_filter
+                    )
+                query_vector = self.embeddings.embed_query(query)
+                return [doc for doc, _ in self.default.search(query_vector, k, metadata_filter)]
+
+            keys = self.partitions_for(metadata_filter, include_archived=include_archived)
+            log.info(f"Fanning search out to partitions: {keys}")
+            if not keys:
+                return []
+            query_vector = self.embeddings.embed_query(query)
+            collections = [self._collection(key) for key in keys]
+            results = self.executor.map(lambda collection: collection.search(query_vector, k, metadata_filter), collections)
+            merged = sorted((hit for hits in results for hit in hits), key=lambda hit: hit[1], reverse=True)
+            return [doc for doc, _ in merged[:k]]
         except Exception as e:
-            raise CustomException(f"Similarity search failed: {e}", e)
-        
+            raise CustomException(f"Similarity search failed: {e}", sys)
+
+
+    def quantization_report(self, queries: List[str], k: int = 4) -> List[Dict]:
+        """
+        Measure the recall@k trade-off of each reduced precision on the stored vectors.
+
+        Exact float32 cosine top-k is the ground truth. For every precision the
+        report gives the index size and recall@k both straight from the quantized
+        scores and after full-precision rescoring of k * RESCORE_FACTOR candidates.
+        """
+        try:
+            if self.partitioned:
+                stores = [self._collection(key).vector_store for key in self.partitions_for()]
+            else:
+                stores = [self.vector_store]
+            ids, vectors = [], []
+            for store in stores:
+                data = store.get(include=["embeddings"])
+                ids.extend(data["ids"])
+                vectors.extend(data["embeddings"])
+            if not ids or not queries:
+                return []
+            full = QuantizedIndex.normalize(vectors)
+            position = {doc_id: i for i, doc_id in enumerate(ids)}
+            query_vectors = QuantizedIndex.normalize(self.embeddings.embed_documents(queries))
+
+            report = []
+            for precision in ("float16", "int8"):
+                index = QuantizedIndex(precision)
+                index.add(ids, full)
+                hits, rescored_hits, total = 0, 0, 0
+                for query_vector in query_vectors:
+                    exact = set(ids[i] for i in np.argsort(-(full @ query_vector))[:k])
+                    approx = [doc_id for doc_id, _ in index.search(query_vector, k)]
+                    shortlist = [doc_id for doc_id, _ in index.search(query_vector, k * config.RESCORE_FACTOR)]
+                    shortlist.sort(key=lambda doc_id: -float(full[position[doc_id]] @ query_vector))
+                    hits += len(exact.intersection(approx))
+                    rescored_hits += len(exact.intersection(shortlist[:k]))
+                    total += len(exact)
+                report.append({
+                    "precision": precision,
+                    "vectors": len(ids),
+                    "index_bytes": index.nbytes,
+                    "float32_bytes": full.nbytes,
+                    "compression": round(full.nbytes / index.nbytes, 2),
+                    "recall_at_k": hits / total,
+                    "rescored_recall_at_k": rescored_hits / total,
+                    "k": k
+                })
+            log.info(f"Quantization report:: {report}")
+            return report
+        except Exception as e:
+            raise CustomException(f"Quantization report failed: {e}", sys)
+
 
     def as_retriever(self, search_type: str = "mmr", k: int = 1, fetch_k: int = 5):
         """Create a retriever with specified search parameters"""
         try:
+            if self.partitioned:
+                # Fan-out search only supports plain similarity across partitions
+                return SimilarityRetriever(store=self, k=k)
             return self.vector_store.as_retriever(
                 search_type=search_type,
                 search_kwargs={"k": k, "fetch_k": fetch_k}
             )
         except Exception as e:
-            raise CustomException(f"Failed to create retriever: {e}", e)
\ No newline at end of file
+            raise CustomException(f"Failed to create retriever: {e}", sys)
+
+
+if __name__ == "__main__":
+    import argparse
+    from src.vector_store.ingestion import get_vector_store
+
+    # Goes through get_vector_store(), so with INGESTION_MODE=proxy the running writer does
+    # the work instead of a second process opening the same Chroma files
+    parser = argparse.ArgumentParser(prog="python -m src.vector_store.db", description="Manage vector store partitions")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("migrate", help="move documents from the unpartitioned collection into partitions")
+    commands.add_parser("partitions", help="list partitions and whether they are archived")
+    for command, help_text in (("archive", "exclude a partition from searches"), ("restore", "make an archived partition searchable again")):
+        commands.add_parser(command, help=help_text).add_argument("key", help="partition key, e.g. 2024-03")
+    args = parser.parse_args()
+
+    store = get_vector_store()
+    try:
+        if args.command == "migrate":
+            print(f"Moved {store.migrate_legacy_collection()} documents into partitions")
+        elif args.command == "partitions":
+            for key, partition in sorted(store.list_partitions().items()):
+                print(f"{key}\t{partition['collection']}\t{'archived' if partition['archived'] else 'active'}")
+        elif args.command == "archive":
+            store.archive_partition(args.key)
+            print(f"Archived partition {args.key}")
+        else:
+            store.restore_partition(args.key)
+            print(f"Restored partition {args.key}")
+    except ValueError as e:
+        sys.exit(str(e))
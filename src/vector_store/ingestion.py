@@ -0,0 +1,219 @@
+"""
+Single-writer ingestion service.
+
+Only one process (the writer) loads the embedding model and opens the
+Chroma store under Config.VECTOR_STORE_DIR. API workers started with
+INGESTION_MODE=proxy send documents and searches to it over a local,
+authenticated socket instead, so uvicorn can run several workers without
+racing on SQLite writes.
+
+Run the writer with:  python -m src.vector_store.ingestion
+"""
+import sys
+import ipaddress
+import threading
+from functools import lru_cache
+from multiprocessing.managers import BaseManager
+from typing import Dict, List, Optional, Tuple
+from langchain_core.documents import Document
+from src.config import Config
+from src.logger import logging as log
+from src.exception import CustomException
+from src.vector_store.db import VectorStore, SimilarityRetriever
+
+
+config = Config()
+
+INGESTION_MODES = ("local", "proxy")
+
+
+class IngestionService:
+    """Owns the writer's VectorStore; writes are serialised, searches run concurrently"""
+
+    def __init__(self, store: Optional[VectorStore] = None) -> None:
+        self.store = store if store is not None else VectorStore()
+        self.write_lock = threading.Lock()
+
+
+    def add_documents(self, documents: List[Document]) -> int:
+        with self.write_lock:
+            try:
+                self.store.add_documents(documents)
+            except CustomException as e:
+                # CustomException cannot be rebuilt on the client side, so send plain text back
+                raise RuntimeError(str(e))
+        return len(documents)
+
+
+    def similarity_search(self, query: str, k: int = 4, metadata_filter: Optional[Dict] = None,
+                          include_archived: bool = False) -> List[Document]:
+        try:
+            if self.store.partitioned:
+                return self.store.similarity_search(query, k=k, metadata_filter=metadata_filter,
+                                                    include_archived=include_archived)
+            return self.store.similarity_search(query, k=k, metadata_filter=metadata_filter)
+        except CustomException as e:
+            raise RuntimeError(str(e))
+
+
+    def quantization_report(self, queries: List[str], k: int = 4) -> List[Dict]:
+        try:
+            return self.store.quantization_report(queries, k=k)
+        except CustomException as e:
+            raise RuntimeError(str(e))
+
+
+    def version(self) -> str:
+        return self.store.version()
+
+
+    def metadatas(self) -> List[Dict]:
+        return self.store.metadatas()
+
+
+    def list_partitions(self) -> Dict[str, Dict]:
+        return self.store.list_partitions()
+
+
+    def archive_partition(self, key: str) -> None:
+        with self.write_lock:
+            self.store.archive_partition(key)
+
+
+    def restore_partition(self, key: str) -> None:
+        with self.write_lock:
+            self.store.restore_partition(key)
+
+
+    def migrate_legacy_collection(self) -> int:
+        with self.write_lock:
+            return self.store.migrate_legacy_collection()
+
+
+def check_endpoint(address: Tuple[str, int], authkey: Optional[str],
+                   allow_remote: bool = config.INGESTION_ALLOW_REMOTE) -> bytes:
+    """
+    Refuse insecure writer settings and return the authkey as bytes.
+
+    The manager protocol unpickles everything it receives, so anyone holding the key
+    can run code in the writer: the key must be set explicitly, and the writer stays
+    on loopback unless INGESTION_ALLOW_REMOTE=true.
+    """
+    if not authkey:
+        raise ValueError("INGESTION_AUTHKEY must be set to a secret shared by the writer and the API workers")
+    host = address[0]
+    try:
+        loopback = ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        loopback = host == "localhost"
+    if not loopback and not allow_remote:
+        raise ValueError(f"Ingestion writer host {host} is not loopback; set INGESTION_ALLOW_REMOTE=true to allow it")
+    return authkey.encode() if isinstance(authkey, str) else authkey
+
+
+class IngestionManager(BaseManager):
+    pass
+
+
+IngestionManager.register("vector_store")
+
+
+class RemoteVectorStore:
+    """Drop-in VectorStore for API workers that proxies every call to the writer process"""
+
+    def __init__(self, address=config.INGESTION_ADDRESS, authkey: Optional[str] = config.INGESTION_AUTHKEY) -> None:
+        try:
+            authkey = check_endpoint(address, authkey)
+            self.manager = IngestionManager(address=address, authkey=authkey)
+            self.manager.connect()
+            self.service = self.manager.vector_store()
+            log.info(f"Connected to ingestion writer at {address}")
+        except Exception as e:
+            raise CustomException(f"Could not connect to ingestion writer at {address}: {e}", sys)
+
+
+    def add_documents(self, documents: List[Document]) -> None:
+        """Send documents to the writer to be embedded and stored"""
+        log.info(f"Sending {len(documents)} documents to the ingestion writer")
+        try:
+            self.service.add_documents(documents)
+        except Exception as e:
+            raise CustomException(f"Error while adding documents: {e}", sys)
+
+
+    def similarity_search(self, query: str, k: int = 4, metadata_filter: Optional[Dict] = None,
+                          include_archived: bool = False) -> List[Document]:
+        """Search for similar documents through the writer"""
+        try:
+            log.info(f"Proxying similarity search with query: {query}")
+            return self.service.similarity_search(query, k, metadata_filter, include_archived)
+        except Exception as e:
+            raise CustomException(f"Similarity search failed: {e}", sys)
+
+
+    def quantization_report(self, queries: List[str], k: int = 4) -> List[Dict]:
+        try:
+            return self.service.quantization_report(queries, k)
+        except Exception as e:
+            raise CustomException(f"Quantization report failed: {e}", sys)
+
+
+    def version(self) -> str:
+        return self.service.version()
+
+
+    def metadatas(self) -> List[Dict]:
+        try:
+            return self.service.metadatas()
+        except Exception as e:
+            raise CustomException(f"Reading stored metadata failed: {e}", sys)
+
+
+    def list_partitions(self) -> Dict[str, Dict]:
+        return self.service.list_partitions()
+
+
+    def archive_partition(self, key: str) -> None:
+        self.service.archive_partition(key)
+
+
+    def restore_partition(self, key: str) -> None:
+        self.service.restore_partition(key)
+
+
+    def migrate_legacy_collection(self) -> int:
+        return self.service.migrate_legacy_collection()
+
+
+    def as_retriever(self, search_type: str = "similarity", k: int = 1, fetch_k: int = 5):
+        """Similarity retriever backed by the writer (other search types are not proxied)"""
+        return SimilarityRetriever(store=self, k=k)
+
+
+@lru_cache(maxsize=None)
+def get_vector_store():
+    """
+    Vector store shared by everything in this process.
+
+    INGESTION_MODE=local opens the store in-process (single worker);
+    INGESTION_MODE=proxy connects to the writer started with `python -m src.vector_store.ingestion`.
+    """
+    if config.INGESTION_MODE not in INGESTION_MODES:
+        raise ValueError(f"INGESTION_MODE must be one of {INGESTION_MODES}, got {config.INGESTION_MODE}")
+    if config.INGESTION_MODE == "proxy":
+        return RemoteVectorStore()
+    return VectorStore()
+
+
+def serve(address=config.INGESTION_ADDRESS, authkey: Optional[str] = config.INGESTION_AUTHKEY) -> None:
+    """Run the single writer process until interrupted"""
+    authkey = check_endpoint(address, authkey)
+    service = IngestionService()
+    IngestionManager.register("vector_store", callable=lambda: service)
+    server = IngestionManager(address=address, authkey=authkey).get_server()
+    log.info(f"Ingestion writer listening on {address}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,66 @@
+import re
+from typing import Dict, List, Optional, Set
+from src.config import Config
+from src.utils import get_invoice_month
+
+
+config = Config()
+
+PARTITION_SCHEMES = ("none", "month", "tenant")
+
+
+def partition_key(partition_by: str, metadata: Dict) -> str:
+    """Partition a document belongs to: its invoice month or its tenant field"""
+    if partition_by == "month":
+        return metadata.get("month") or get_invoice_month(metadata.get("date", "Unknown"))
+    return str(metadata.get(config.TENANT_FIELD) or "unknown")
+
+
+def collection_name(key: str, taken: Set[str]) -> str:
+    """Chroma-safe collection name for a partition key, unique among `taken`"""
+    slug = re.sub(r"[^A-Za-z0-9_-]+", "_", key).strip("_-")[:40] or "unknown"
+    name = f"{config.DB_NAME}__{slug}"
+    suffix = 1
+    while name in taken:
+        suffix += 1
+        name = f"{config.DB_NAME}__{slug}_{suffix}"
+    return name
+
+
+def filter_values(metadata_filter: Optional[Dict], field: str) -> Optional[Set[str]]:
+    """Values a Chroma where-filter pins `field` to, or None if it does not constrain it"""
+    if not metadata_filter:
+        return None
+    if "$and" in metadata_filter:
+        for clause in metadata_filter["$and"]:
+            values = filter_values(clause, field)
+            if values is not None:
+                return values
+        return None
+    condition = metadata_filter.get(field)
+    if condition is None:
+        return None
+    if isinstance(condition, dict):
+        if "$eq" in condition:
+            return {str(condition["$eq"])}
+        if "$in" in condition:
+            return {str(value) for value in condition["$in"]}
+        return None
+    return {str(condition)}
+
+
+def select_partitions(partitions: Dict[str, Dict], partition_by: str, metadata_filter: Optional[Dict] = None,
+                      include_archived: bool = False) -> List[str]:
+    """Keys of the partitions a search with this filter has to touch"""
+    if partition_by == "month":
+        keys = filter_values(metadata_filter, "month")
+        dates = filter_values(metadata_filter, "date")
+        if keys is None and dates is not None:
+            keys = {get_invoice_month(date) for date in dates}
+    else:
+        keys = filter_values(metadata_filter, config.TENANT_FIELD)
+
+    return [
+        key for key, partition in partitions.items()
+        if (keys is None or key in keys) and (include_archived or not partition["archived"])
+    ]
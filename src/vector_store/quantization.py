@@ -0,0 +1,254 @@
+import os
+import numpy as np
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from src.logger import logging as log
+
+
+SUPPORTED_PRECISIONS = ("float32", "float16", "int8")
+SEARCH_BLOCK_ROWS = 4096  # rows cast to float32 at a time while scoring
+TAIL_SUFFIX = ".tail"  # rows persisted since the last full snapshot
+
+
+class QuantizedIndex:
+    """
+    Reduced-precision search index over a collection's embeddings.
+
+    Vectors are L2-normalised and held in memory either as float16 or as symmetric
+    per-vector scalar-quantized int8 codes (code * scale ~= vector), i.e. ~1/2 or
+    ~1/4 of the float32 size. Scores are cosine similarities. When `vectors_path`
+    is given, the float32 vectors are also appended to that raw file and
+    memory-mapped, so the top candidates can be rescored at full precision
+    without keeping them resident or asking Chroma for its embeddings.
+
+    The index is append-only: ids must be unique, which also lets readers take a
+    consistent snapshot while a writer appends. On disk it is a full snapshot plus a
+    tail of batches appended since (see persist), so an ingest does not rewrite it all.
+    """
+
+    def __init__(self, precision: str = "int8", vectors_path: Optional[str] = None) -> None:
+        if precision not in ("float16", "int8"):
+            raise ValueError(f"Unsupported quantization precision: {precision}")
+        self.precision = precision
+        self.vectors_path = vectors_path
+        self.ids: List[str] = []
+        self.positions: Dict[str, int] = {}
+        self.codes: Optional[np.ndarray] = None
+        self.scales: Optional[np.ndarray] = None
+        self.vectors: Optional[np.memmap] = None
+        self.snapshot_rows = 0  # rows in the saved snapshot
+        self.tail_rows = 0  # rows appended to the tail after it
+
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+    @property
+    def nbytes(self) -> int:
+        """Memory used by the stored codes (and int8 scales); the memory-mapped float32 file is not counted"""
+        size = self.codes.nbytes if self.codes is not None else 0
+        if self.scales is not None:
+            size += self.scales.nbytes
+        return size
+
+
+    @staticmethod
+    def normalize(vectors) -> np.ndarray:
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+    def quantize(self, vectors) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """Returns (codes, scales) for a batch of vectors; scales is None for float16"""
+        vectors = self.normalize(vectors)
+        if self.precision == "float16":
+            return vectors.astype(np.float16), None
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+
+    def _map_vectors(self, rows: int, dim: int) -> None:
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, dim)) if rows else None
+
+
+    def add(self, ids: List[str], vectors) -> None:
+        """Quantize and append vectors; ids already in the index are rejected"""
+        self.add_batches([(ids, vectors)])
+
+
+    def add_batches(self, batches: Iterable[Tuple[List[str], Any]]) -> None:
+        """
+        Append several (ids, vectors) batches, stacking the codes once at the end, so a
+        rebuild does not copy the whole index for every batch. Only the compact codes of
+        earlier batches are held while later ones are read.
+        """
+        seen = set(self.positions)
+        new_ids, new_codes, new_scales = [], [], []
+        dim = None
+        for ids, vectors in batches:
+            if not len(ids):
+                continue
+            duplicates = [doc_id for doc_id in ids if doc_id in seen]
+            if duplicates or len(set(ids)) != len(ids):
+                raise ValueError(f"Ids already in the index: {duplicates or ids}")
+            seen.update(ids)
+            vectors = self.normalize(vectors)
+            codes, scales = self.quantize(vectors)
+            if self.vectors_path:
+                with open(self.vectors_path, "ab") as f:
+                    f.write(vectors.tobytes())
+            new_ids.extend(ids)
+            new_codes.append(codes)
+            if scales is not None:
+                new_scales.append(scales)
+            dim = vectors.shape[1]
+        if not new_ids:
+            return
+
+        if self.vectors_path:
+            self._map_vectors(len(self.ids) + len(new_ids), dim)
+        # Build new arrays rather than mutating, so concurrent searches see a consistent snapshot
+        self.codes = np.vstack(([self.codes] if self.codes is not None else []) + new_codes)
+        if new_scales:
+            self.scales = np.concatenate(([self.scales] if self.scales is not None else []) + new_scales)
+        self.positions.update({doc_id: len(self.ids) + i for i, doc_id in enumerate(new_ids)})
+        self.ids = self.ids + new_ids
+
+
+    def search(self, query_vector, k: int, allowed_ids: Optional[Set[str]] = None) -> List[Tuple[str, float]]:
+        """Approximate top-k (id, cosine similarity) pairs, optionally restricted to allowed_ids"""
+        codes, scales, ids = self.codes, self.scales, self.ids
+        if codes is None or not ids or k <= 0:
+            return []
+        # add() only appends, so the common prefix is consistent even mid-write
+        n = min(len(codes), len(ids), len(scales) if scales is not None else len(codes))
+        ids = ids[:n]
+        query = self.normalize(query_vector)[0]
+        k = min(k, n)
+
+        # Score in fixed-size blocks keeping a running top-k, so a query never holds a
+        # float32 copy of more than SEARCH_BLOCK_ROWS rows
+        top_rows = np.empty(0, dtype=np.int64)
+        top_scores = np.empty(0, dtype=np.float32)
+        for start in range(0, n, SEARCH_BLOCK_ROWS):
+            stop = min(start + SEARCH_BLOCK_ROWS, n)
+            scores = codes[start:stop].astype(np.float32) @ query
+            if scales is not None:
+                scores *= scales[start:stop]
+            if allowed_ids is not None:
+                mask = np.fromiter((doc_id in allowed_ids for doc_id in ids[start:stop]), dtype=bool, count=stop - start)
+                scores = np.where(mask, scores, -np.inf)
+            rows = np.concatenate([top_rows, np.arange(start, stop)])
+            scores = np.concatenate([top_scores, scores])
+            if len(scores) > k:
+                keep = np.argpartition(-scores, k - 1)[:k]
+                rows, scores = rows[keep], scores[keep]
+            top_rows, top_scores = rows, scores
+
+        order = np.argsort(-top_scores)
+        return [(ids[row], float(score)) for row, score in zip(top_rows[order], top_scores[order]) if np.isfinite(score)]
+
+
+    def rescore(self, query_vector, candidate_ids: List[str], k: int) -> List[Tuple[str, float]]:
+        """Re-rank candidates by exact cosine similarity against the memory-mapped float32 vectors"""
+        vectors = self.vectors
+        if vectors is None:
+            raise ValueError("Index has no full-precision vectors to rescore with")
+        rows = [self.positions[doc_id] for doc_id in candidate_ids if self.positions.get(doc_id, len(vectors)) < len(vectors)]
+        if not rows:
+            return []
+        scores = vectors[np.asarray(rows)] @ self.normalize(query_vector)[0]
+        order = np.argsort(-scores)[:k]
+        return [(self.ids[rows[i]], float(scores[i])) for i in order]
+
+
+    def _arrays(self, start: int = 0) -> Dict[str, np.ndarray]:
+        arrays = {"ids": np.asarray(self.ids[start:], dtype=str), "codes": self.codes[start:]}
+        if self.scales is not None:
+            arrays["scales"] = self.scales[start:]
+        return arrays
+
+
+    def save(self, path: str) -> None:
+        """Write a full snapshot to `path` and drop the tail it supersedes"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **self._arrays())
+        os.replace(tmp_path, path)
+        if os.path.exists(path + TAIL_SUFFIX):
+            os.remove(path + TAIL_SUFFIX)
+        self.snapshot_rows, self.tail_rows = len(self), 0
+        log.info(f"Saved {self.precision} index with {len(self)} vectors to {path}")
+
+
+    def persist(self, path: str) -> None:
+        """
+        Write the rows added since the last save or persist. They are appended to the tail
+        file; the snapshot is only rewritten once the tail would outgrow it, so ingesting a
+        batch costs O(batch) on disk (amortised) rather than O(index).
+        """
+        start = self.snapshot_rows + self.tail_rows
+        new = len(self) - start
+        if new <= 0:
+            return
+        if self.tail_rows + new > self.snapshot_rows:
+            self.save(path)
+            return
+        arrays = self._arrays(start)
+        with open(path + TAIL_SUFFIX, "ab") as f:
+            for name in ("ids", "codes", "scales"):
+                if name in arrays:
+                    np.save(f, arrays[name], allow_pickle=False)
+        self.tail_rows += new
+
+
+    @classmethod
+    def load(cls, path: str, precision: str, vectors_path: Optional[str] = None) -> Optional["QuantizedIndex"]:
+        """
+        Loads a saved index (snapshot plus tail), or returns None if it is missing, was built
+        with another precision, is damaged, or its float32 vectors file does not match it.
+        """
+        if not os.path.exists(path):
+            return None
+        index = cls(precision, vectors_path)
+        with np.load(path) as data:
+            codes = data["codes"]
+            if codes.dtype != np.dtype(precision):
+                return None
+            parts = {"ids": [data["ids"]], "codes": [codes], "scales": [data["scales"]] if "scales" in data.files else []}
+        index.snapshot_rows = len(codes)
+
+        tail_path = path + TAIL_SUFFIX
+        if os.path.exists(tail_path):
+            try:
+                with open(tail_path, "rb") as f:
+                    size = os.path.getsize(tail_path)
+                    while f.tell() < size:
+                        ids = np.load(f, allow_pickle=False)
+                        parts["ids"].append(ids)
+                        parts["codes"].append(np.load(f, allow_pickle=False))
+                        if parts["scales"]:
+                            parts["scales"].append(np.load(f, allow_pickle=False))
+                        index.tail_rows += len(ids)
+            except (ValueError, EOFError, OSError):
+                # a batch cut short by a crash; the caller rebuilds
+                return None
+
+        index.ids = [str(doc_id) for ids in parts["ids"] for doc_id in ids]
+        index.codes = np.vstack(parts["codes"])
+        index.scales = np.concatenate(parts["scales"]) if parts["scales"] else None
+        if len(index.codes) != len(index.ids) or (index.scales is not None and len(index.scales) != len(index.ids)):
+            return None
+        index.positions = {doc_id: i for i, doc_id in enumerate(index.ids)}
+        if len(index.positions) != len(index.ids):
+            return None
+        if vectors_path:
+            rows, dim = index.codes.shape
+            if not os.path.exists(vectors_path) or os.path.getsize(vectors_path) != rows * dim * 4:
+                return None
+            index._map_vectors(rows, dim)
+        return index
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# src.config prompts for these when they are missing
+os.environ.setdefault("GROQ_API_KEY", "test-key")
+os.environ.setdefault("API_URL", "http://localhost:8080")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,184 @@
+import asyncio
+import zipfile
+import pytest
+from fastapi import HTTPException, Request
+from src import admission
+from src.admission import (AdmissionGate, check_content_length, check_zip_limits, client_id, per_worker,
+                           upload_form)
+
+
+def make_request(headers=None, body_chunks=(), client=("10.0.0.1", 1234)):
+    messages = [{"type": "http.request", "body": chunk, "more_body": i < len(body_chunks) - 1}
+                for i, chunk in enumerate(body_chunks)] or [{"type": "http.request", "body": b"", "more_body": False}]
+
+    async def receive():
+        return messages.pop(0)
+
+    scope = {
+        "type": "http", "method": "POST", "path": "/", "query_string": b"", "client": client,
+        "headers": [(key.lower().encode(), value.encode()) for key, value in (headers or {}).items()],
+    }
+    return Request(scope, receive)
+
+
+def test_per_worker_splits_limits_but_keeps_at_least_one():
+    limits = {"concurrency": 2, "queue_size": 4, "queue_timeout": 30, "client_quota": 10}
+    assert per_worker(limits, 1) == limits
+    assert per_worker(limits, 4) == {"concurrency": 1, "queue_size": 1, "queue_timeout": 30, "client_quota": 3}
+
+
+def test_gate_queues_then_rejects_when_the_queue_is_full():
+    async def scenario():
+        gate = AdmissionGate("test", concurrency=1, queue_size=1, queue_timeout=5, client_quota=100)
+        release = asyncio.Event()
+
+        async def hold():
+            async with gate.admit("a"):
+                await release.wait()
+
+        first = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        second = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        assert gate.stats()["active"] == 1
+        assert gate.stats()["queue_depth"] == 1
+
+        with pytest.raises(HTTPException) as error:
+            async with gate.admit("b"):
+                pass
+        assert error.value.status_code == 503
+        assert "Retry-After" in error.value.headers
+
+        release.set()
+        await asyncio.gather(first, second)
+        return gate.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["admitted"] == 2
+    assert stats["rejected"]["queue_full"] == 1
+
+
+def test_gate_rejects_after_queue_timeout():
+    async def scenario():
+        gate = AdmissionGate("test", concurrency=1, queue_size=1, queue_timeout=0.01, client_quota=100)
+        async with gate.admit("a"):
+            with pytest.raises(HTTPException) as error:
+                async with gate.admit("b"):
+                    pass
+        return gate, error.value
+
+    gate, error = asyncio.run(scenario())
+    assert error.status_code == 503
+    assert gate.rejected["queue_timeout"] == 1
+    assert gate.waiting == 0
+
+
+def test_gate_enforces_the_client_quota():
+    async def scenario():
+        gate = AdmissionGate("test", concurrency=4, queue_size=4, queue_timeout=1, client_quota=2)
+        for _ in range(2):
+            async with gate.admit("a"):
+                pass
+        with pytest.raises(HTTPException) as error:
+            async with gate.admit("a"):
+                pass
+        # other clients have their own bucket
+        async with gate.admit("b"):
+            pass
+        return error.value
+
+    error = asyncio.run(scenario())
+    assert error.status_code == 429
+    assert int(error.headers["Retry-After"]) >= 1
+
+
+def test_client_id_uses_the_configured_proxy_header(monkeypatch):
+    request = make_request(headers={"X-Forwarded-For": "1.1.1.1, 203.0.113.9"})
+    monkeypatch.setattr(admission.config, "CLIENT_ID_HEADER", None)
+    assert client_id(request) == "10.0.0.1"
+    monkeypatch.setattr(admission.config, "CLIENT_ID_HEADER", "X-Forwarded-For")
+    assert client_id(request) == "203.0.113.9"
+    assert client_id(make_request()) == "10.0.0.1"
+
+
+def test_content_length_over_the_limit_is_rejected():
+    check_content_length(make_request(headers={"Content-Length": "100"}), max_bytes=100)
+    with pytest.raises(HTTPException) as error:
+        check_content_length(make_request(headers={"Content-Length": "101"}), max_bytes=100)
+    assert error.value.status_code == 413
+
+
+def multipart_body(files):
+    boundary = "testboundary"
+    parts = [
+        (f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{name}.bin"\r\n'
+         f'Content-Type: application/octet-stream\r\n\r\n').encode() + content + b"\r\n"
+        for name, content in files.items()
+    ]
+    return b"".join(parts) + f"--{boundary}--\r\n".encode(), {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+
+
+def test_upload_form_returns_the_named_uploads():
+    body, headers = multipart_body({"invoice_file": b"zip", "policy_file": b"pdf"})
+
+    async def scenario():
+        async with upload_form(make_request(headers, [body]), ["invoice_file", "policy_file"]) as (invoice, policy):
+            return await invoice.read(), await policy.read()
+
+    assert asyncio.run(scenario()) == (b"zip", b"pdf")
+
+
+def test_upload_form_stops_reading_past_the_limit():
+    body, headers = multipart_body({"invoice_file": b"x" * 5000, "policy_file": b"pdf"})
+    chunks = [body[i:i + 1000] for i in range(0, len(body), 1000)]
+
+    async def scenario():
+        async with upload_form(make_request(headers, chunks), ["invoice_file", "policy_file"], max_bytes=2000):
+            pass
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(scenario())
+    assert error.value.status_code == 413
+
+
+def test_upload_form_requires_every_field():
+    body, headers = multipart_body({"invoice_file": b"zip"})
+
+    async def scenario():
+        async with upload_form(make_request(headers, [body]), ["invoice_file", "policy_file"]):
+            pass
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(scenario())
+    assert error.value.status_code == 422
+
+
+def write_zip(path, files):
+    with zipfile.ZipFile(path, "w") as zip_ref:
+        for name, content in files.items():
+            zip_ref.writestr(name, content)
+    return str(path)
+
+
+def test_check_zip_limits(tmp_path, monkeypatch):
+    monkeypatch.setattr(admission.config, "MAX_ZIP_MEMBERS", 2)
+    monkeypatch.setattr(admission.config, "MAX_ZIP_MEMBER_BYTES", 10)
+    monkeypatch.setattr(admission.config, "MAX_ZIP_TOTAL_BYTES", 15)
+
+    check_zip_limits(write_zip(tmp_path / "ok.zip", {"a.pdf": b"12345", "b.pdf": b"12345"}))
+
+    cases = {
+        "many.zip": {"a.pdf": b"1", "b.pdf": b"1", "c.pdf": b"1"},
+        "big_member.zip": {"a.pdf": b"x" * 11},
+        "big_total.zip": {"a.pdf": b"x" * 8, "b.pdf": b"x" * 8},
+    }
+    for name, files in cases.items():
+        with pytest.raises(HTTPException) as error:
+            check_zip_limits(write_zip(tmp_path / name, files))
+        assert error.value.status_code == 413, name
+
+    not_a_zip = tmp_path / "invoices.zip"
+    not_a_zip.write_bytes(b"not a zip")
+    with pytest.raises(HTTPException) as error:
+        check_zip_limits(str(not_a_zip))
+    assert error.value.status_code == 400
@@ -0,0 +1,109 @@
+import pytest
+from langchain_core.documents import Document
+from src.aggregates import ClaimAggregates
+from src.exception import CustomException
+
+
+def claim(claim_id, employee, month, status, amount):
+    return Document(page_content="", metadata={
+        "claim_id": claim_id, "employee_name": employee, "month": month,
+        "status": status, "approved_amount": amount
+    })
+
+
+CLAIMS = [
+    claim("a", "Asha", "2024-03", "accept", 100.0),
+    claim("b", "Asha", "2024-04", "partially accept", 40.0),
+    claim("c", "Ravi", "2024-03", "reject", 0.0),
+]
+
+
+class FakeStore:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def metadatas(self):
+        return [dict(document.metadata) for document in self.documents]
+
+
+@pytest.fixture
+def aggregates(tmp_path):
+    return ClaimAggregates(str(tmp_path / "aggregates.sqlite3"))
+
+
+def test_summary_overall_and_filtered(aggregates):
+    aggregates.record(CLAIMS)
+
+    overall = aggregates.summary()
+    assert overall["total_claims"] == 3
+    assert overall["total_approved_amount"] == 140.0
+    assert overall["by_status"]["reject"] == {"claims": 1, "approved_amount": 0.0}
+
+    asha = aggregates.summary(employee_name="Asha")
+    assert asha["total_claims"] == 2
+    assert asha["total_approved_amount"] == 140.0
+
+    march = aggregates.summary(month="2024-03")
+    assert march["total_claims"] == 2
+    assert set(march["by_status"]) == {"accept", "reject"}
+
+    assert aggregates.summary(employee_name="Asha", month="2024-04")["total_approved_amount"] == 40.0
+    assert aggregates.summary(employee_name="Nobody")["total_claims"] == 0
+
+
+def test_recording_a_retried_batch_counts_each_claim_once(aggregates):
+    aggregates.record(CLAIMS[:2])
+    aggregates.record(CLAIMS)
+    aggregates.record([CLAIMS[2], CLAIMS[2]])
+
+    assert aggregates.summary()["total_claims"] == 3
+    assert aggregates.summary()["total_approved_amount"] == 140.0
+
+
+def test_new_table_is_built_from_the_vector_store(tmp_path):
+    aggregates = ClaimAggregates(str(tmp_path / "aggregates.sqlite3"), vector_store=FakeStore(CLAIMS))
+    assert aggregates.summary()["total_claims"] == 3
+
+    # an existing table is not rebuilt on start-up
+    aggregates = ClaimAggregates(str(tmp_path / "aggregates.sqlite3"), vector_store=FakeStore(CLAIMS + CLAIMS))
+    assert aggregates.summary()["total_claims"] == 3
+
+
+def test_rebuild_replaces_the_totals(aggregates):
+    aggregates.record(CLAIMS)
+    assert aggregates.rebuild(FakeStore(CLAIMS[:1])) == 1
+    assert aggregates.summary()["total_claims"] == 1
+    aggregates.record(CLAIMS)
+    assert aggregates.summary()["total_claims"] == 3
+
+
+class UnavailableStore:
+    def metadatas(self):
+        raise ConnectionError("writer is not running")
+
+
+def test_an_interrupted_backfill_is_redone_on_the_next_start(tmp_path):
+    path = str(tmp_path / "aggregates.sqlite3")
+    with pytest.raises(CustomException):
+        ClaimAggregates(path, vector_store=UnavailableStore())
+
+    aggregates = ClaimAggregates(path, vector_store=FakeStore(CLAIMS))
+    assert aggregates.summary()["total_claims"] == 3
+
+
+def test_backfill_skips_claims_recorded_meanwhile(tmp_path):
+    path = str(tmp_path / "aggregates.sqlite3")
+    ClaimAggregates(path).record(CLAIMS[:1])
+    aggregates = ClaimAggregates(path, vector_store=FakeStore(CLAIMS))
+    assert aggregates.summary()["total_claims"] == 3
+
+
+def test_backfill_derives_month_and_amount_for_older_claims(tmp_path):
+    legacy = Document(page_content="", metadata={
+        "invoice_id": "INV-1", "employee_name": "Asha", "status": "partially accept",
+        "date": "12/03/2024", "reason": "Meals capped by clause 4. Approved Amount: Rs. 1,250.50"
+    })
+    aggregates = ClaimAggregates(str(tmp_path / "aggregates.sqlite3"), vector_store=FakeStore([legacy]))
+    march = aggregates.summary(month="2024-03")
+    assert march["total_claims"] == 1
+    assert march["total_approved_amount"] == 1250.5
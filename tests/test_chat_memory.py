@@ -0,0 +1,117 @@
+import sqlite3
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from src.chat_memory import ChatMemory, RetrievalCache, history_overflow, trim_to_budget
+
+
+def conversation(turns):
+    messages = []
+    for i in range(turns):
+        messages += [
+            HumanMessage(f"question {i} " + "word " * 20),
+            AIMessage("", tool_calls=[{"name": "retrieve", "args": {"query": str(i)}, "id": f"call-{i}"}]),
+            ToolMessage("context " * 20, tool_call_id=f"call-{i}"),
+            AIMessage(f"answer {i} " + "word " * 20),
+        ]
+    return messages
+
+
+def test_trim_to_budget_keeps_recent_turns_starting_on_a_human_message():
+    messages = [SystemMessage("system")] + conversation(10)
+    trimmed = trim_to_budget(messages, max_tokens=200)
+    assert trimmed[0].type == "system"
+    assert trimmed[1].type == "human"
+    assert trimmed[-1] is messages[-1]
+    assert len(trimmed) < len(messages)
+    assert trim_to_budget(messages, max_tokens=100000) == messages
+
+
+def test_trim_to_budget_still_sends_an_oversized_question():
+    question = HumanMessage("word " * 1000)
+    assert trim_to_budget([question], max_tokens=10) == [question]
+
+
+def test_history_overflow_drops_the_oldest_whole_turns():
+    messages = conversation(5)
+    dropped = history_overflow(messages, max_messages=6)
+    # cutting at 6 would start on an AI message, so the partial turn goes too
+    assert dropped == messages[:16]
+    assert messages[len(dropped)].type == "human"
+    assert history_overflow(messages, max_messages=100) == []
+
+
+def test_history_overflow_without_a_human_turn_drops_nothing():
+    assert history_overflow([AIMessage("a"), AIMessage("b")], max_messages=1) == []
+
+
+def test_retrieval_cache_evicts_the_least_recently_used():
+    cache = RetrievalCache(None, None, "v1", max_size=2)
+    cache.put("a", "A")
+    cache.put("b", "B")
+    assert cache.get("a") == "A"
+    cache.put("c", "C")
+    assert cache.get("b") is None
+    assert list(cache.entries) == ["a", "c"]
+
+
+def test_retrieval_cache_is_dropped_when_the_store_changes():
+    entries = {"a": "A"}
+    assert RetrievalCache(entries, "v1", "v1").get("a") == "A"
+    assert RetrievalCache(entries, "v1", "v2").get("a") is None
+    assert RetrievalCache(entries, None, "v1").entries == {}
+
+
+def test_retrieval_cache_key_covers_tool_name_and_arguments():
+    call = {"name": "retrieve", "args": {"query": "q", "metadata_filter": {"b": 1, "a": 2}}, "id": "1"}
+    reordered = {"name": "retrieve", "args": {"metadata_filter": {"a": 2, "b": 1}, "query": "q"}, "id": "2"}
+    assert RetrievalCache.key(call) == RetrievalCache.key(reordered)
+    assert RetrievalCache.key(call) != RetrievalCache.key({**call, "name": "other"})
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "chat.sqlite3")
+    conn = sqlite3.connect(path)
+    # the columns of langgraph's SqliteSaver tables that ChatMemory touches
+    conn.execute("CREATE TABLE checkpoints (thread_id TEXT, checkpoint_ns TEXT, checkpoint_id TEXT, checkpoint BLOB)")
+    conn.execute("CREATE TABLE writes (thread_id TEXT, checkpoint_ns TEXT, checkpoint_id TEXT, task_id TEXT, value BLOB)")
+    for thread_id in ("t1", "t2"):
+        for checkpoint_id in ("0001", "0002", "0003"):
+            conn.execute("INSERT INTO checkpoints VALUES (?, '', ?, x'00')", (thread_id, checkpoint_id))
+            conn.execute("INSERT INTO writes VALUES (?, '', ?, 'task', x'00')", (thread_id, checkpoint_id))
+    conn.commit()
+    conn.close()
+    return path
+
+
+def rows(db_path, table, thread_id):
+    with sqlite3.connect(db_path) as conn:
+        return [row[0] for row in conn.execute(
+            f"SELECT checkpoint_id FROM {table} WHERE thread_id = ? ORDER BY checkpoint_id", (thread_id,)
+        )]
+
+
+def test_after_turn_keeps_only_the_latest_checkpoint_of_that_session(db_path):
+    memory = ChatMemory(db_path, ttl_seconds=3600)
+    memory.after_turn("t1")
+    assert rows(db_path, "checkpoints", "t1") == ["0003"]
+    assert rows(db_path, "writes", "t1") == ["0003"]
+    assert rows(db_path, "checkpoints", "t2") == ["0001", "0002", "0003"]
+
+
+def test_expire_deletes_idle_sessions(db_path):
+    memory = ChatMemory(db_path, ttl_seconds=100)
+    memory.after_turn("t1")
+    memory.after_turn("t2")
+    with sqlite3.connect(db_path) as conn:
+        last_used = conn.execute("SELECT last_used FROM chat_sessions WHERE thread_id = 't1'").fetchone()[0]
+        conn.execute("UPDATE chat_sessions SET last_used = ? WHERE thread_id = 't1'", (last_used - 1000,))
+
+    assert memory.expire(now=last_used + 50) == 1
+    assert rows(db_path, "checkpoints", "t1") == []
+    assert rows(db_path, "writes", "t1") == []
+    assert rows(db_path, "checkpoints", "t2") == ["0003"]
+
+
+def test_after_turn_works_before_any_checkpoint_exists(tmp_path):
+    ChatMemory(str(tmp_path / "empty.sqlite3"), ttl_seconds=100).after_turn("t1")
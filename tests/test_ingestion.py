@@ -0,0 +1,57 @@
+import pickle
+import sys
+import pytest
+
+pytest.importorskip("langchain_chroma")
+pytest.importorskip("langchain_huggingface")
+
+from src.exception import CustomException
+from src.vector_store.ingestion import IngestionService, check_endpoint
+
+
+@pytest.mark.parametrize("host", ["127.0.0.1", "127.0.0.2", "::1", "localhost"])
+def test_loopback_hosts_are_accepted(host):
+    assert check_endpoint((host, 50055), "secret", allow_remote=False) == b"secret"
+
+
+@pytest.mark.parametrize("host", ["0.0.0.0", "10.0.0.5", "writer.internal", "::"])
+def test_remote_hosts_need_an_explicit_opt_in(host):
+    with pytest.raises(ValueError):
+        check_endpoint((host, 50055), "secret", allow_remote=False)
+    assert check_endpoint((host, 50055), "secret", allow_remote=True) == b"secret"
+
+
+@pytest.mark.parametrize("authkey", [None, ""])
+def test_missing_authkey_is_rejected(authkey):
+    with pytest.raises(ValueError):
+        check_endpoint(("127.0.0.1", 50055), authkey, allow_remote=True)
+
+
+def test_bytes_authkey_is_passed_through():
+    assert check_endpoint(("127.0.0.1", 50055), b"secret", allow_remote=False) == b"secret"
+
+
+class FailingStore:
+    partitioned = False
+
+    def fail(self, *args, **kwargs):
+        try:
+            raise OSError("disk full")
+        except OSError:
+            raise CustomException("Error while adding documents: disk full", sys)
+
+    add_documents = similarity_search = quantization_report = fail
+
+
+@pytest.mark.parametrize("call", [
+    lambda service: service.add_documents([]),
+    lambda service: service.similarity_search("query"),
+    lambda service: service.quantization_report(["query"]),
+])
+def test_store_errors_reach_the_client_as_picklable_runtime_errors(call):
+    service = IngestionService(store=FailingStore())
+    with pytest.raises(RuntimeError) as error:
+        call(service)
+    assert "disk full" in str(error.value)
+    # the manager pickles exceptions back to the API worker
+    assert "disk full" in str(pickle.loads(pickle.dumps(error.value)))
@@ -0,0 +1,58 @@
+import pytest
+from src.config import Config
+from src.vector_store.partitioning import (collection_name, filter_values, partition_key,
+                                           select_partitions)
+
+
+PARTITIONS = {
+    "2024-01": {"collection": "c1", "archived": True},
+    "2024-02": {"collection": "c2", "archived": False},
+    "2024-03": {"collection": "c3", "archived": False},
+}
+
+
+@pytest.mark.parametrize("metadata_filter, expected", [
+    (None, None),
+    ({}, None),
+    ({"status": "reject"}, None),
+    ({"month": "2024-03"}, {"2024-03"}),
+    ({"month": {"$eq": "2024-03"}}, {"2024-03"}),
+    ({"month": {"$in": ["2024-02", "2024-03"]}}, {"2024-02", "2024-03"}),
+    ({"month": {"$ne": "2024-03"}}, None),
+    ({"$and": [{"status": "reject"}, {"month": "2024-02"}]}, {"2024-02"}),
+])
+def test_filter_values(metadata_filter, expected):
+    assert filter_values(metadata_filter, "month") == expected
+
+
+def test_month_filter_touches_only_its_partitions():
+    assert select_partitions(PARTITIONS, "month", {"month": "2024-03"}) == ["2024-03"]
+    assert select_partitions(PARTITIONS, "month", {"date": "15/02/2024"}) == ["2024-02"]
+    assert select_partitions(PARTITIONS, "month", {"month": "2023-12"}) == []
+
+
+def test_unfiltered_search_skips_archived_partitions():
+    assert select_partitions(PARTITIONS, "month") == ["2024-02", "2024-03"]
+    assert select_partitions(PARTITIONS, "month", include_archived=True) == ["2024-01", "2024-02", "2024-03"]
+    assert select_partitions(PARTITIONS, "month", {"month": "2024-01"}) == []
+
+
+def test_tenant_filter():
+    partitions = {"Anjaneya K": {"collection": "a", "archived": False},
+                  "Gaurav": {"collection": "g", "archived": False}}
+    assert select_partitions(partitions, "tenant", {Config.TENANT_FIELD: "Gaurav"}) == ["Gaurav"]
+    assert select_partitions(partitions, "tenant", {"month": "2024-03"}) == ["Anjaneya K", "Gaurav"]
+
+
+def test_partition_key():
+    assert partition_key("month", {"month": "2024-03", "date": "01/01/2020"}) == "2024-03"
+    assert partition_key("month", {"date": "12-Mar-2024"}) == "2024-03"
+    assert partition_key("tenant", {Config.TENANT_FIELD: "Gaurav"}) == "Gaurav"
+    assert partition_key("tenant", {}) == "unknown"
+
+
+def test_collection_name_is_chroma_safe_and_unique():
+    name = collection_name("Anjaneya K.", set())
+    assert name == f"{Config.DB_NAME}__Anjaneya_K"
+    assert collection_name("Anjaneya K!", {name}) == f"{name}_2"
+    assert collection_name("???", set()) == f"{Config.DB_NAME}__unknown"
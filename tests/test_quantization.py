@@ -0,0 +1,166 @@
+import os
+import tracemalloc
+import numpy as np
+import pytest
+from src.vector_store import quantization
+from src.vector_store.quantization import QuantizedIndex
+
+
+@pytest.fixture
+def vectors():
+    rng = np.random.default_rng(0)
+    return rng.normal(size=(300, 64)).astype(np.float32)
+
+
+@pytest.fixture
+def ids(vectors):
+    return [f"doc-{i}" for i in range(len(vectors))]
+
+
+def exact_top_k(vectors, query, k):
+    scores = QuantizedIndex.normalize(vectors) @ QuantizedIndex.normalize(query)[0]
+    return [f"doc-{i}" for i in np.argsort(-scores)[:k]]
+
+
+@pytest.mark.parametrize("precision, ratio", [("float16", 2), ("int8", 3.5)])
+def test_index_is_smaller_than_float32(vectors, ids, precision, ratio):
+    index = QuantizedIndex(precision)
+    index.add(ids, vectors)
+    assert index.nbytes * ratio <= vectors.nbytes
+
+
+@pytest.mark.parametrize("precision", ["float16", "int8"])
+def test_recall_against_exact_search(vectors, ids, precision, tmp_path):
+    index = QuantizedIndex(precision, str(tmp_path / "vectors.bin"))
+    index.add(ids, vectors)
+    rng = np.random.default_rng(1)
+    hits = rescored_hits = 0
+    for query in vectors[:20] + 0.5 * rng.normal(size=(20, 64)):
+        exact = set(exact_top_k(vectors, query, 5))
+        hits += len(exact.intersection(doc_id for doc_id, _ in index.search(query, 5)))
+        shortlist = [doc_id for doc_id, _ in index.search(query, 20)]
+        rescored_hits += len(exact.intersection(doc_id for doc_id, _ in index.rescore(query, shortlist, 5)))
+    assert hits / 100 >= 0.9
+    assert rescored_hits / 100 >= 0.98
+
+
+def test_search_respects_allowed_ids(vectors, ids):
+    index = QuantizedIndex("int8")
+    index.add(ids, vectors)
+    results = index.search(vectors[0], 5, allowed_ids={"doc-7", "doc-9"})
+    assert {doc_id for doc_id, _ in results} == {"doc-7", "doc-9"}
+
+
+def test_duplicate_ids_are_rejected(vectors, ids):
+    index = QuantizedIndex("int8")
+    index.add(ids[:10], vectors[:10])
+    with pytest.raises(ValueError):
+        index.add(ids[:1], vectors[:1])
+
+
+@pytest.mark.parametrize("precision", ["float16", "int8"])
+def test_save_load_round_trip(vectors, ids, precision, tmp_path):
+    vectors_path = str(tmp_path / "vectors.bin")
+    index = QuantizedIndex(precision, vectors_path)
+    index.add(ids[:100], vectors[:100])
+    index.add(ids[100:], vectors[100:])
+    index.save(str(tmp_path / "index.npz"))
+
+    loaded = QuantizedIndex.load(str(tmp_path / "index.npz"), precision, vectors_path)
+    assert loaded.ids == ids
+    assert loaded.search(vectors[42], 3) == index.search(vectors[42], 3)
+    assert loaded.rescore(vectors[42], ["doc-1", "doc-42"], 1)[0][0] == "doc-42"
+
+
+def test_load_rejects_other_precision_and_truncated_vectors(vectors, ids, tmp_path):
+    vectors_path = tmp_path / "vectors.bin"
+    index = QuantizedIndex("int8", str(vectors_path))
+    index.add(ids, vectors)
+    index.save(str(tmp_path / "index.npz"))
+
+    assert QuantizedIndex.load(str(tmp_path / "index.npz"), "float16") is None
+    vectors_path.write_bytes(vectors_path.read_bytes()[:-4])
+    assert QuantizedIndex.load(str(tmp_path / "index.npz"), "int8", str(vectors_path)) is None
+    assert QuantizedIndex.load(str(tmp_path / "missing.npz"), "int8") is None
+
+
+@pytest.mark.parametrize("precision", ["float16", "int8"])
+def test_block_scoring_matches_scoring_everything_at_once(vectors, ids, precision, monkeypatch):
+    index = QuantizedIndex(precision)
+    index.add(ids, vectors)
+    query = vectors[3] + 0.1
+    monkeypatch.setattr(quantization, "SEARCH_BLOCK_ROWS", len(ids))
+    expected = index.search(query, 10, allowed_ids=set(ids[::2]))
+    monkeypatch.setattr(quantization, "SEARCH_BLOCK_ROWS", 7)
+    results = index.search(query, 10, allowed_ids=set(ids[::2]))
+    assert [doc_id for doc_id, _ in results] == [doc_id for doc_id, _ in expected]
+    assert np.allclose([score for _, score in results], [score for _, score in expected], atol=1e-5)
+
+
+def test_search_memory_is_bounded_by_the_block_size():
+    rng = np.random.default_rng(2)
+    vectors = rng.normal(size=(40000, 128)).astype(np.float32)
+    index = QuantizedIndex("int8")
+    index.add_batches((ids, vectors[i:i + 10000]) for i, ids in
+                      ((i, [f"doc-{j}" for j in range(i, i + 10000)]) for i in range(0, 40000, 10000)))
+    del vectors
+
+    tracemalloc.start()
+    index.search(rng.normal(size=128), 5)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # a full float32 copy would be 40000 * 128 * 4 bytes
+    assert peak < 40000 * 128 * 4 / 4
+
+
+def test_add_batches_matches_add(vectors, ids):
+    one = QuantizedIndex("int8")
+    one.add(ids, vectors)
+    batched = QuantizedIndex("int8")
+    batched.add_batches([(ids[:100], vectors[:100]), ([], []), (ids[100:], vectors[100:])])
+    assert batched.ids == one.ids
+    assert np.array_equal(batched.codes, one.codes)
+    with pytest.raises(ValueError):
+        batched.add_batches([(["new"], vectors[:1]), (["new"], vectors[:1])])
+
+
+@pytest.mark.parametrize("precision", ["float16", "int8"])
+def test_persist_appends_a_tail_and_compacts(vectors, ids, precision, tmp_path):
+    path = str(tmp_path / "index.npz")
+    vectors_path = str(tmp_path / "vectors.bin")
+    index = QuantizedIndex(precision, vectors_path)
+    index.add(ids[:200], vectors[:200])
+    index.persist(path)
+    snapshot = os.path.getsize(path)
+
+    index.add(ids[200:250], vectors[200:250])
+    index.persist(path)
+    index.add(ids[250:260], vectors[250:260])
+    index.persist(path)
+    assert os.path.getsize(path) == snapshot
+    assert os.path.exists(path + quantization.TAIL_SUFFIX)
+
+    loaded = QuantizedIndex.load(path, precision, vectors_path)
+    assert loaded.ids == ids[:260]
+    assert loaded.search(vectors[255], 3) == index.search(vectors[255], 3)
+
+    # once the tail would outgrow the snapshot it is folded back in
+    loaded.add(ids[260:], vectors[260:])
+    loaded.add_batches([])
+    loaded.persist(path)
+    loaded.add(["extra"], vectors[:1] + 1)
+    loaded.persist(path)
+    reloaded = QuantizedIndex.load(path, precision, vectors_path)
+    assert reloaded.ids == ids + ["extra"]
+
+
+def test_load_rejects_a_truncated_tail(vectors, ids, tmp_path):
+    path = tmp_path / "index.npz"
+    index = QuantizedIndex("int8")
+    index.add(ids[:200], vectors[:200])
+    index.persist(str(path))
+    index.add(ids[200:], vectors[200:])
+    index.persist(str(path))
+    tail = tmp_path / ("index.npz" + quantization.TAIL_SUFFIX)
+    tail.write_bytes(tail.read_bytes()[:-10])
+    assert QuantizedIndex.load(str(path), "int8") is None
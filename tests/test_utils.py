@@ -0,0 +1,36 @@
+import pytest
+from src.utils import get_invoice_month, get_approved_amount
+
+
+@pytest.mark.parametrize("date, month", [
+    ("12/03/2024", "2024-03"),
+    ("05/03/2024", "2024-03"),
+    ("03/25/2024", "2024-03"),
+    ("12-03-2024", "2024-03"),
+    ("12.03.2024", "2024-03"),
+    ("2024-03-12", "2024-03"),
+    ("2024-03-12T10:30:00", "2024-03"),
+    ("12/03/2024 10:30 AM", "2024-03"),
+    ("12 March 2024", "2024-03"),
+    ("12  Mar  2024", "2024-03"),
+    ("12-Mar-2024", "2024-03"),
+    ("March 12, 2024", "2024-03"),
+    ("Unknown", "unknown"),
+    ("", "unknown"),
+    ("31/02/2024", "unknown"),
+])
+def test_get_invoice_month(date, month):
+    assert get_invoice_month(date) == month
+
+
+@pytest.mark.parametrize("approved_amount, reason, status, amount", [
+    (1250.5, "", "accept", 1250.5),
+    ("1,250.50", "", "partially accept", 1250.5),
+    ("Rs. 800", "Approved Amount: Rs. 1,000", "partially accept", 800.0),
+    ("Unknown", "Meals capped by clause 4. Approved Amount: Rs. 1,250.50", "partially accept", 1250.5),
+    (None, "Approved amount is 50% of the bill", "partially accept", 0.0),
+    ("Unknown", "No amount mentioned", "accept", 0.0),
+    (900, "Approved Amount: Rs. 900", "reject", 0.0),
+])
+def test_get_approved_amount(approved_amount, reason, status, amount):
+    assert get_approved_amount(approved_amount, reason, status) == amount